@@ -3,6 +3,9 @@ from src.data import data
 from src.text_processing.preprocess_word import lower, lemma
 from src.utils.timing import tick, tock
 
+# Source: http://crr.ugent.be/archives/1330
+concreteness_path = f"{data.preprocessed_dataset_path}/concreteness.csv"
+
 _d = None
 
 
@@ -20,7 +23,7 @@ def word_concreteness(word):
     """
     global _d
     if _d is None:
-        _df = pd.read_csv(f"{data.preprocessed_dataset_path}/concreteness.csv")
+        _df = pd.read_csv(concreteness_path)
         keys = _df["Word"].values
         values = _df["Conc.M"].values
         _d = dict(zip(keys, values))
@@ -34,4 +34,6 @@ __pdoc__['decorator_timing_feature'] = False
 __pdoc__['inspector'] = False
 __pdoc__['read_feature_dataframe'] = False
 __pdoc__['read_feature_dictionary'] = False
+__pdoc__['registry'] = False
+__pdoc__['stats'] = False
 __pdoc__['not_used'] = False
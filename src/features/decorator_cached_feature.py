@@ -1,68 +1,247 @@
+"""
+Persistent cache of the values returned by the features.
+
+Values are stored in a SQLite database, which is safe to be shared among the threads of `array_feature`
+and `construct_graph`, and among processes. Every thread (of every process) opens its own connection,
+the database is in WAL mode, so that readers do not block writers.
+
+Entries are keyed by the name of the feature and by a canonical encoding of the values of its arguments.
+`None` return values are cached as well (negative caching), since most features return `None` when the
+remote services do not know about an entity, and that rarely changes.
+"""
+
 from functools import wraps
-# import os.path
-# from src.features.read_feature_dictionary import read_feature_dictionary as rdict
-# from src.features.read_feature_dataframe import read_feature_dataframe as rdf
-# import logging
-# import inspect
-# from src.data import data
+from collections import Counter
+from src.data.data import preprocessed_dataset_path
+import threading
+import sqlite3
+import pickle
+import json
+import time
+import os
 
 
-def cached_feature(func):
+# Path of the SQLite database
+cache_path = f"{preprocessed_dataset_path}/feature_cache.sqlite"
 
-    @wraps(func)
-    def func_wrapper(*args, **kwargs):
-        """To be applied to the features we compute once and cache in develop mode.
-           Read the cached value from the saved file, if in develop mode.
+# Whether the cache is read and written at all
+enabled = True
+
+# Maximum number of entries kept in the cache, the least recently used are evicted beyond it
+max_entries = 2000000
+
+# Time to live of the entries, in seconds. None never expires
+default_ttl = 60*60*24*90
+# The negative entries expire faster: they can be due to the remote services lagging behind
+default_negative_ttl = 60*60*24*30
+
+# Feature name -> time to live of its entries, for features whose values change more often than the default
+ttl = {
+    'artist_solo_end_activity_year': 60*60*24*30,
+    'artist_band_end_activity_year': 60*60*24*30,
+    'artist_death_date': 60*60*24*30,
+    'artist_awards': 60*60*24*30,
+    'artist_relationships': 60*60*24*30,
+}
+
+# Feature name -> time to live of its negative entries
+negative_ttl = {
+    'artist_death_date': 60*60*24*7,
+    'artist_solo_end_activity_year': 60*60*24*7,
+    'artist_band_end_activity_year': 60*60*24*7,
+}
+
+# Eviction of the least recently used entries happens every this many insertions
+_eviction_period = 1000
+
+# Feature name -> number of values read from the cache / computed
+hits = Counter()
+misses = Counter()
+
+_lock = threading.Lock()
+_local = threading.local()
+_insertions = 0
+
+# Keys of the nodes which do not contribute to the content of a node
+_not_content_keys = set(['id', 'graph', 'mergiable_id'])
+
+
+def configure(path=None, max_size=None, enable=None):
+    """Change the settings of the cache. The connections open so far are dropped.
+
+    Args:
+        path (str, optional): path of the SQLite database.
+        max_size (int, optional): maximum number of entries.
+        enable (bool, optional): whether to use the cache.
+    """
+    global cache_path, max_entries, enabled
+    if path is not None:
+        cache_path = path
+    if max_size is not None:
+        max_entries = max_size
+    if enable is not None:
+        enabled = enable
+    _local.__dict__.clear()
+
+
+def cache_stats():
+    """Returns, for every feature that has been called, the number of hits and misses of the cache.
+
+    Returns:
+        dict: feature name -> {'hits': int, 'misses': int, 'hit_rate': float}
+    """
+    with _lock:
+        names = set(hits) | set(misses)
+        return {n: {'hits': hits[n], 'misses': misses[n], 'hit_rate': hits[n]/(hits[n]+misses[n])}
+                for n in sorted(names)}
+
+
+def last_call_cached():
+    """Whether the last cached feature called in the current thread read its value from the cache.
+       With features calling other cached features, it refers to the outermost one, which returns last.
+    """
+    return getattr(_local, 'hit', False)
+
+
+def reset_last_call_cached():
+    _local.hit = False
+
+
+def reset_cache_stats():
+    with _lock:
+        hits.clear()
+        misses.clear()
 
-           It makes a number of assumptions, which are compatible with what array_feature assumes:
 
-           - The feature function has just one return value
-           - The first parameter is loaded from a df which have:
-                - as first column the index of the new feature we are going to create
-                - as second column the values in which the first parameter ranges
+def clear_cache(feature_name=None):
+    """Delete the entries of a feature, or the whole cache if feature_name is None."""
+    conn = _connection()
+    with conn:
+        if feature_name is None:
+            conn.execute("DELETE FROM cache")
+        else:
+            conn.execute("DELETE FROM cache WHERE feature = ?", (feature_name,))
 
-           This method works also in demo mode: if it cannot find the value on the second column of
-           the dataframe, then it means that the actual value of the feature was not computed,
-           i.e. we are in demo mode.
 
-           Ideally, we could think of saving the values which were not known, so that we can increase
-           our database of known values and avoid to recompute them if happen again
+def _connection():
+    """Connection of the current thread. It is re-opened after a fork, since SQLite connections
+       cannot be shared among processes.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid() or _local.path != cache_path:
+        os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+        conn = sqlite3.connect(cache_path, timeout=60, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=60000")
+        conn.execute("""CREATE TABLE IF NOT EXISTS cache (
+                            feature TEXT NOT NULL,
+                            key TEXT NOT NULL,
+                            value BLOB,
+                            created REAL NOT NULL,
+                            accessed REAL NOT NULL,
+                            PRIMARY KEY (feature, key))""")
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.path = cache_path
+    return conn
+
+
+def _canonical(value):
+    """Encoding of an argument which depends on its content only: for nodes, the attributes
+       which identify the node in a specific graph are discarded.
+    """
+    if isinstance(value, dict):
+        value = {k: v for k, v in value.items() if k not in _not_content_keys}
+    return value
+
+
+def _key(args, kwargs):
+    content = [_canonical(a) for a in args] + [[k, _canonical(v)] for k, v in sorted(kwargs.items())]
+    return json.dumps(content, sort_keys=True, default=repr, separators=(',', ':'))
+
+
+def _read(name, key):
+    """Returns a tuple (found, value)"""
+    conn = _connection()
+    row = conn.execute("SELECT value, created FROM cache WHERE feature = ? AND key = ?",
+                       (name, key)).fetchone()
+    if row is None:
+        return False, None
+
+    value = pickle.loads(row[0])
+    if value is None:
+        expiration = negative_ttl.get(name, default_negative_ttl)
+    else:
+        expiration = ttl.get(name, default_ttl)
+    now = time.time()
+    if expiration is not None and now - row[1] > expiration:
+        return False, None
+
+    conn.execute("UPDATE cache SET accessed = ? WHERE feature = ? AND key = ?", (now, name, key))
+    return True, value
+
+
+def _write(name, key, value):
+    global _insertions
+    conn = _connection()
+    now = time.time()
+    conn.execute("INSERT OR REPLACE INTO cache (feature, key, value, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                 (name, key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), now, now))
+
+    with _lock:
+        _insertions += 1
+        evict = _insertions % _eviction_period == 0
+    if evict:
+        _evict(conn)
+
+
+def _evict(conn):
+    """Delete the least recently used entries exceeding max_entries"""
+    with conn:
+        n = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if n > max_entries:
+            conn.execute("""DELETE FROM cache WHERE rowid IN
+                            (SELECT rowid FROM cache ORDER BY accessed LIMIT ?)""", (n - max_entries,))
+
+
+def cached_feature(func):
+
+    @wraps(func)
+    def func_wrapper(*args, **kwargs):
+        """To be applied to the features whose values are expensive to compute (e.g. the ones querying
+           remote services) and stable over time.
+
+           The value is read from the cache, if present and not expired. Otherwise, it is computed and saved.
+           Passing recreate=True skips the reading, so that the value is re-computed and overwritten.
 
         Returns:
             ? -- feature value
         """
-        # if not 'recreate' in kwargs:
-        #     if os.path.exists(f"{data.feature_path}/{func.__name__}.npy"):
-        #         params = list(inspect.signature(func).parameters.keys())
-        #         df_index = rdf(params[0])
-        #         if params[0] in kwargs:
-        #             param_value = kwargs[params[0]]
-        #         else:
-        #             param_value = args[0]
-        #         row = df_index[df_index.iloc[:, 1] == param_value]
-        #         if len(row) > 0:
-        #             # Develop mode
-        #             if len(row) > 1:
-        #                 logging.getLogger('root.features').warning(
-        #                     f"Incoherence, with a value of the first arg I should be able to slice just one row of the index dataframe. \
-        #                                     This means that there are more than one {params[0]} with the index value {param_value}")
-        #                 row = row.head(1)
-
-        #             id = row.iloc[0, 0]
-        #             assert id in rdict(
-        #                 func.__name__), f"Incoherence, this id should be into the dictionary by design"
-        #             return_value = rdict(func.__name__)[id]
-
-        #             logging.getLogger('root.features').warning(
-        #                 f"Reading cached value of {func.__name__} with the index value {param_value[0:50] if type(param_value) == str else param_value}: {return_value[0:50] if type(return_value) == str else return_value}")
-
-        #             return return_value
-        # else:
-        #     assert kwargs['recreate'] == True, "The recreate value should be used only in case we want to recreate the feature"
-
-        # Either we want to recreate the feature or we were not able to retrieve the cached value
-        kwargs.pop('recreate', None)
+        recreate = kwargs.pop('recreate', False)
+
+        if not enabled:
+            return func(*args, **kwargs)
+
+        name = func.__name__
+        key = _key(args, kwargs)
+
+        if not recreate:
+            found, value = _read(name, key)
+            if found:
+                with _lock:
+                    hits[name] += 1
+                _local.hit = True
+                return value
+
         r = func(*args, **kwargs)
+
+        with _lock:
+            misses[name] += 1
+        _write(name, key, r)
+
+        _local.hit = False
         return r
 
     return func_wrapper
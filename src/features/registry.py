@@ -0,0 +1,53 @@
+"""
+Registry of the features in the `used` sub-module.
+
+It is built once, at import time, so that the properties of features that are needed while constructing graphs
+(signature, arguments, in-node types, defaults, edge types, out-node types, ...) are plain lookups,
+instead of being recomputed by reflection every time.
+"""
+
+from src.features import used
+from src.features.inspector import in_node_types, out_node_types, edge_types
+from inspect import signature, Parameter
+from collections import defaultdict
+import importlib
+
+
+def _load_feature(name):
+    """Every file in the used folder contains a feature with the same name of the file."""
+    return getattr(importlib.import_module(f"src.features.used.{name}"), name)
+
+
+# Feature name -> feature function
+functions = {name: _load_feature(name) for name in sorted(used.__all__)}
+
+# Feature name -> signature of the feature
+signatures = {name: signature(func) for name, func in functions.items()}
+
+# Feature name -> tuple with the names of the arguments of the feature
+args = {name: tuple(sig.parameters.keys()) for name, sig in signatures.items()}
+
+# Feature name -> tuple with, for every argument, the node types it accepts
+args_types = {name: tuple(tuple(types) for types in in_node_types(func).values()) for name, func in functions.items()}
+
+# Feature name -> dictionary with the default values of the arguments which have one
+defaults = {name: {arg: v.default for arg, v in sig.parameters.items() if v.default is not Parameter.empty}
+            for name, sig in signatures.items()}
+
+# Feature name -> dictionary with, for every edge type the feature produces, the node types that edge can lead to
+out_types = {name: {edge_type: out_node_types(func, edge_type=edge_type) for edge_type in edge_types(func)}
+             for name, func in functions.items()}
+
+# Features whose edges are not counted in interestingess's shortness heuristics
+entailed = set(name for name, func in functions.items() if func.__annotations__.get('entailed', False))
+
+# Features that query remote services (MusicBrainz, Wikidata), i.e. that are bound by I/O
+remote = set(name for name, func in functions.items() if func.__annotations__.get('remote', False))
+
+# Node type -> list of (feature name, argument position) to which a node of that type can be fed
+args_of_type = defaultdict(list)
+for _name in functions:
+    for _idx, _types in enumerate(args_types[_name]):
+        for _t in _types:
+            args_of_type[_t].append((_name, _idx))
+args_of_type = dict(args_of_type)
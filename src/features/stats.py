@@ -0,0 +1,160 @@
+"""
+Statistics on the cost and the yield of features, collected while constructing graphs and persisted across runs.
+
+For every feature:
+
+* calls: number of calls;
+* cached: number of calls whose value was read from the feature cache, see decorator_cached_feature;
+* time: total seconds spent in the calls not read from the cache;
+* latency: histogram of the latency of the calls not read from the cache, with buckets bounded by latency_buckets;
+* remote_calls: number of calls querying remote services, cache hits excluded;
+* none: number of calls returning None;
+* nodes: number of nodes produced;
+* segue_hits: number of times a node produced by the feature lies on the path of a segue emitted in a story.
+
+So the cost model (expected_latency, expected_yield_per_second) measures the cost of actually computing a feature,
+and does not depend on how warm the cache is.
+
+Statistics collected in a run are kept in memory, and added to the ones on disk by save_stats.
+"""
+
+from src.data.data import preprocessed_dataset_path
+from src.utils.utils_ngx_graph import father
+from collections import defaultdict
+import numpy as np
+import threading
+import bisect
+import os
+
+stats_path = f"{preprocessed_dataset_path}/feature_stats.npy"
+
+# Upper bounds, in seconds, of the buckets of the latency histograms. The last bucket is unbounded
+latency_buckets = [0.001, 0.01, 0.1, 0.5, 1, 2, 5, 10]
+
+_lock = threading.Lock()
+
+
+def _empty():
+    return {'calls': 0, 'cached': 0, 'time': 0.0, 'latency': [0] * (len(latency_buckets) + 1), 'remote_calls': 0,
+            'none': 0, 'nodes': 0, 'segue_hits': 0}
+
+
+# Statistics collected since the last save
+_delta = defaultdict(_empty)
+
+# Statistics on disk, loaded lazily
+_saved = None
+
+
+def record_call(name, elapsed, return_value, remote=False, cached=False):
+    """Record a call of a feature, which took elapsed seconds. Calls read from the cache count as calls only"""
+    with _lock:
+        s = _delta[name]
+        s['calls'] += 1
+        s['none'] += 1 if return_value is None else 0
+        if cached:
+            s['cached'] += 1
+        else:
+            s['time'] += elapsed
+            s['latency'][bisect.bisect_left(latency_buckets, elapsed)] += 1
+            s['remote_calls'] += 1 if remote else 0
+
+
+def record_nodes(name, n):
+    with _lock:
+        _delta[name]['nodes'] += n
+
+
+def record_segues(segues):
+    """Count, for every feature, the nodes it produced that are on the paths of segues.
+
+    Args:
+        segues (list): segues in dictionary form, None elements are skipped
+    """
+    hits = defaultdict(int)
+    for segue in segues:
+        if segue is None:
+            continue
+        for n in [segue['n1'], segue['n2']]:
+            f = father(n)
+            while f is not None:
+                function = n['graph'][f['id']][n['id']]['generating_function']
+                if function != 'init':
+                    hits[function] += 1
+                n = f
+                f = father(n)
+
+    with _lock:
+        for function, h in hits.items():
+            _delta[function]['segue_hits'] += h
+
+
+def _load():
+    global _saved
+    if _saved is None:
+        _saved = np.load(stats_path, allow_pickle=True).item() if os.path.exists(stats_path) else {}
+    return _saved
+
+
+def _add(s1, s2):
+    # Statistics saved before a key was introduced lack it
+    s = {k: s1.get(k, 0) + s2.get(k, 0) for k in _empty() if k != 'latency'}
+    s['latency'] = [a + b for a, b in zip(s1['latency'], s2['latency'])]
+    return s
+
+
+def feature_stats():
+    """Statistics of every feature, on disk and collected since then.
+
+    Returns:
+        dict: feature name -> dictionary of statistics
+    """
+    with _lock:
+        saved = _load()
+        return {name: _add(saved.get(name, _empty()), _delta.get(name, _empty())) for name in set(saved) | set(_delta)}
+
+
+def save_stats():
+    """Add the statistics collected since the last save to the ones on disk.
+       The file is read again before writing, so that runs in parallel do not lose each other statistics.
+    """
+    global _saved
+    with _lock:
+        saved = np.load(stats_path, allow_pickle=True).item() if os.path.exists(stats_path) else {}
+        for name, s in _delta.items():
+            saved[name] = _add(saved.get(name, _empty()), s)
+
+        os.makedirs(os.path.dirname(stats_path), exist_ok=True)
+        tmp_path = f"{stats_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, saved)
+        os.replace(tmp_path, stats_path)
+
+        _saved = saved
+        _delta.clear()
+
+
+def expected_yield_per_second(name, all_stats=None, prior_calls=10, prior_hit_rate=0.1, min_time=0.001):
+    """Expected number of segue hits per second of cost of a call of a feature.
+       Features with few calls are smoothed towards a prior, so that new features are not starved.
+
+    Args:
+        name (str): feature name
+        all_stats (dict, optional): statistics as returned by feature_stats. If None, they are retrieved
+        prior_calls (int, optional): weight of the prior, in number of calls
+        prior_hit_rate (float, optional): prior of the segue hits per call
+        min_time (float, optional): lower bound of the latency, in seconds
+
+    Returns:
+        float
+    """
+    s = (feature_stats() if all_stats is None else all_stats).get(name, _empty())
+    hit_rate = (s['segue_hits'] + prior_calls * prior_hit_rate) / (s['calls'] + prior_calls)
+    return hit_rate / max(expected_latency(name, all_stats), min_time)
+
+
+def expected_latency(name, all_stats=None):
+    """Average latency, in seconds, of a call of a feature not read from the cache, 0 if there was none"""
+    s = (feature_stats() if all_stats is None else all_stats).get(name, _empty())
+    computed = s['calls'] - s.get('cached', 0)
+    return s['time'] / computed if computed > 0 else 0.0
@@ -4,6 +4,7 @@ Created on Wed Apr 22 2020
 @author Giovanni Gabbolini
 """
 
+from src.utils.decorator_annotations import annotations
 from src.features.decorator_timing_feature import timing_feature
 from src.features.array_feature import array_feature
 from src.features.decorator_musicbrainz_feature import musicbrainz_feature
@@ -14,6 +15,7 @@ import datetime
 import pandas as pd
 
 
+@annotations({'remote': True})
 @musicbrainz_feature
 @cached_feature
 @timing_feature
@@ -6,11 +6,15 @@ Created on --
 
 import musicbrainzngs
 from src.features.decorator_musicbrainz_feature import musicbrainz_feature
+from src.utils.decorator_annotations import annotations
 from src.features.decorator_timing_feature import timing_feature
+from src.features.decorator_cached_feature import cached_feature
 import logging
 
 
+@annotations({'remote': True})
 @musicbrainz_feature
+@cached_feature
 @timing_feature
 def area_city(area_musicbrainz_id) -> 'city_musicbrainz':
     """Given an area id in musicbrainz, returns the city associated with that area
@@ -4,6 +4,7 @@ Created on Wed Apr 15 2020
 @author Giovanni Gabbolini
 """
 
+from src.utils.decorator_annotations import annotations
 from src.features.decorator_timing_feature import timing_feature
 from src.features.array_feature import array_feature
 from src.features.decorator_cached_feature import cached_feature
@@ -12,6 +13,7 @@ import re
 import logging
 
 
+@annotations({'remote': True})
 @cached_feature
 @timing_feature
 def artist_awards(artist_wikidata_id) -> 'award_wikidata':
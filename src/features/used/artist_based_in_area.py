@@ -4,6 +4,7 @@ Created on Wed Apr 16 2020
 @author Giovanni Gabbolini
 """
 
+from src.utils.decorator_annotations import annotations
 from src.features.decorator_timing_feature import timing_feature
 from src.features.array_feature import array_feature
 from src.features.decorator_musicbrainz_feature import musicbrainz_feature
@@ -12,6 +13,7 @@ import musicbrainzngs
 import logging
 
 
+@annotations({'remote': True})
 @musicbrainz_feature
 @cached_feature
 @timing_feature
@@ -5,6 +5,7 @@ Created on Wed Apr 15 2020
 """
 
 
+from src.utils.decorator_annotations import annotations
 from src.features.decorator_timing_feature import timing_feature
 from src.features.decorator_musicbrainz_feature import musicbrainz_feature
 from src.features.decorator_cached_feature import cached_feature
@@ -13,6 +14,7 @@ import musicbrainzngs
 import logging
 
 
+@annotations({'remote': True})
 @musicbrainz_feature
 @cached_feature
 @timing_feature
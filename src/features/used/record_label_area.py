@@ -4,14 +4,18 @@ Created on Wed Apr 15 2020
 @author Giovanni Gabbolini
 """
 
+from src.utils.decorator_annotations import annotations
 from src.features.decorator_timing_feature import timing_feature
+from src.features.decorator_cached_feature import cached_feature
 from src.features.array_feature import array_feature
 from src.features.decorator_musicbrainz_feature import musicbrainz_feature
 import musicbrainzngs
 import logging
 
 
+@annotations({'remote': True})
 @musicbrainz_feature
+@cached_feature
 @timing_feature
 def record_label_area(record_label_musicbrainz_id) -> 'area_musicbrainz_id':
     """Extracts the area the actual record label is based in
@@ -4,7 +4,9 @@ Created on Wed Apr 15 2020
 @author Giovanni Gabbolini
 """
 
+from src.utils.decorator_annotations import annotations
 from src.features.decorator_timing_feature import timing_feature
+from src.features.decorator_cached_feature import cached_feature
 from src.features.array_feature import array_feature
 from src.features.decorator_musicbrainz_feature import musicbrainz_feature
 import musicbrainzngs
@@ -12,7 +14,9 @@ import logging
 import re
 
 
+@annotations({'remote': True})
 @musicbrainz_feature
+@cached_feature
 @timing_feature
 def record_label_dissolution_year(record_label_musicbrainz_id) -> 'year':
     """Extracts the year a record label stopped to exist.
@@ -0,0 +1,260 @@
+"""
+Interestingness of batches of segues, computed with numpy arrays.
+
+The three scores of interestingness_GB depend on the root paths of the two nodes of a segue:
+
+* rarity: the segue type is the trace of n1, the compare function and the trace of n2 reversed;
+* unpopularity: the minimum popularity on the path is the minimum of the ones of the root paths of n1 and n2;
+* shortness: the length of the path is the sum of the ones of the root paths of n1 and n2, without entailed edges.
+
+NodeColumns keeps them as columns: length and minimum popularity, from the aggregates stored in the trees
+(see path_aggregates), and the id of the trace in a table of distinct traces. A batch of segues is then scored
+by indexing the columns with the rows of its nodes, and the rarity is looked up once per distinct segue type.
+Scores are the same as the ones of interestingness.
+
+Rows are keyed by the content hash of the trees (see content_hash), so they stay valid for as long as the columns
+are kept, whatever happens to the tree objects, and trees with the same content share them.
+"""
+
+from src.interestingness.interestingness_GB import load_count_sample, path_aggregates
+from src.knowledge_graph.compact_segues import CompactSegues
+from src.knowledge_graph.content_hash import tree_hash
+from src.utils.utils_ngx_graph import father
+from src.utils.timing import timed_phase
+import numpy as np
+
+
+class NodeColumns():
+
+    """Per-node columns the interestingness of segues is computed from, for the nodes of any tree.
+       The minimum popularity is nan if the type of a node in the root path is unknown, and inf for the source.
+    """
+
+    def __init__(self):
+        self.count = load_count_sample()
+        # (hash of tree, node id) -> row
+        self.rows = {}
+        self.length = []
+        self.popularity = []
+        self.trace = []
+        # Distinct traces, and the id of each
+        self.traces = []
+        self._trace_ids = {}
+        # hash of tree -> rows of its nodes, by position
+        self._tree_rows = {}
+        self._arrays = None
+
+    def _trace_id(self, trace):
+        if trace not in self._trace_ids:
+            self._trace_ids[trace] = len(self.traces)
+            self.traces.append(trace)
+        return self._trace_ids[trace]
+
+    def row(self, n):
+        """Row of the node n, computed if it is not there yet"""
+        key = (tree_hash(n['graph']), n['id'])
+        if key not in self.rows:
+            f = father(n)
+            if f is None:
+                trace = (n['type'],)
+            else:
+                trace = self.traces[self.trace[self.row(f)]] + (n['graph'][f['id']][n['id']]['type'], n['type'])
+            length, popularity, unknown = path_aggregates(n['graph'])[n['id']]
+            popularity = np.nan if unknown else popularity
+
+            self.rows[key] = len(self.length)
+            self.length.append(length)
+            self.popularity.append(popularity)
+            self.trace.append(self._trace_id(trace))
+            self._arrays = None
+        return self.rows[key]
+
+    def tree_rows(self, g):
+        """Rows of the nodes of g, as an array indexed by the position of the nodes in g"""
+        h = tree_hash(g)
+        if h not in self._tree_rows:
+            self._tree_rows[h] = np.array([self.row(g._node[n]) for n in g._node], dtype=np.int64)
+        return self._tree_rows[h]
+
+    def arrays(self):
+        """The columns, as arrays: length, popularity, trace"""
+        if self._arrays is None:
+            self._arrays = (np.array(self.length, dtype=np.float64), np.array(self.popularity, dtype=np.float64),
+                            np.array(self.trace, dtype=np.int64))
+        return self._arrays
+
+    def score(self, row_1, row_2, function, rar_w, unpop_w, shortness_w):
+        """As scores, for a single segue, without building arrays. Cheaper for a few segues
+
+        Args:
+            row_1, row_2 (int): rows of n1 and n2
+            function (str): name of the compare function
+            rar_w, unpop_w, shortness_w (float): see interestingness
+
+        Returns:
+            float
+        """
+        segue_type = self.traces[self.trace[row_1]] + (function,) + self.traces[self.trace[row_2]][::-1]
+        rar = float(self.count['segue_type_rarity'].get(segue_type, -np.inf))
+        popularity_1, popularity_2 = float(self.popularity[row_1]), float(self.popularity[row_2])
+        unpop = -np.inf if popularity_1 != popularity_1 or popularity_2 != popularity_2 else 1 - min(popularity_1, popularity_2)
+        shortness = 2/(float(self.length[row_1]) + float(self.length[row_2]))
+        return rar_w*rar + unpop_w*unpop + shortness_w*shortness
+
+    def ranges(self, rows, starts):
+        """Ranges of the columns over groups of rows, e.g. the nodes merged root paths stand for.
+
+        Args:
+            rows (np.array): rows of the groups, one group after the other
+            starts (np.array): position in rows of the first row of every group. Groups are not empty
+
+        Returns:
+            tuple: for every group, as arrays: minimum and maximum length, minimum popularity (nan if all are nan),
+                   maximum popularity (nan if any is nan), trace (-1 if its rows have different ones);
+                   and a dict, group -> traces, for the groups whose rows have different ones
+        """
+        length, popularity, trace = self.arrays()
+        length, popularity, trace = length[rows], popularity[rows], trace[rows]
+        min_trace = np.minimum.reduceat(trace, starts)
+        max_trace = np.maximum.reduceat(trace, starts)
+        ends = np.append(starts[1:], len(rows))
+        mixed = {idx: set(trace[starts[idx]:ends[idx]].tolist()) for idx in np.flatnonzero(min_trace != max_trace).tolist()}
+        return (np.minimum.reduceat(length, starts), np.maximum.reduceat(length, starts), np.fmin.reduceat(popularity, starts),
+                np.maximum.reduceat(popularity, starts), np.where(min_trace == max_trace, min_trace, -1), mixed)
+
+    def bounds(self, ranges_1, groups_1, ranges_2, groups_2, function, rar_w, unpop_w, shortness_w):
+        """Upper bounds of the interestingness of groups of segues with the same compare function.
+           The segues of a group join every node of a group of ranges_1 with every node of a group of ranges_2:
+           each score is bounded by its range over those couples, with a cost linear in the groups, rather than in the couples.
+
+        Args:
+            ranges_1, ranges_2 (tuple): as returned by ranges
+            groups_1, groups_2 (np.array): for every group of segues, the group of ranges_1 and of ranges_2 of its nodes
+            function (str): name of the compare function
+            rar_w, unpop_w, shortness_w (float): see interestingness
+
+        Returns:
+            np.array: inf where the ranges give no bound, i.e. where it would be nan
+        """
+        min_length_1, max_length_1, min_popularity_1, max_popularity_1, trace_1, mixed_1 = ranges_1
+        min_length_2, max_length_2, min_popularity_2, max_popularity_2, trace_2, mixed_2 = ranges_2
+
+        def rarity(t_1, t_2):
+            return self.count['segue_type_rarity'].get(self.traces[t_1] + (function,) + self.traces[t_2][::-1], -np.inf)
+
+        # The rarity is looked up once per distinct segue type, as in scores
+        t_1, t_2 = trace_1[groups_1], trace_2[groups_2]
+        single = (t_1 >= 0) & (t_2 >= 0)
+        n_traces = len(self.traces)
+        types, type_ids = np.unique(t_1[single] * n_traces + t_2[single], return_inverse=True)
+        rar = np.array([rarity(*divmod(t, n_traces)) for t in types.tolist()] + [0.0])[type_ids.reshape(-1)]
+        min_rar = np.empty(len(groups_1))
+        max_rar = np.empty(len(groups_1))
+        min_rar[single] = rar
+        max_rar[single] = rar
+        for idx in np.flatnonzero(~single).tolist():
+            values = [rarity(a, b) for a in mixed_1.get(int(groups_1[idx]), [t_1[idx]]) for b in mixed_2.get(int(groups_2[idx]), [t_2[idx]])]
+            min_rar[idx] = min(values)
+            max_rar[idx] = max(values)
+
+        # A couple with a node of nan popularity has unpopularity -inf
+        with np.errstate(invalid='ignore', divide='ignore'):
+            min_popularity_1, min_popularity_2 = min_popularity_1[groups_1], min_popularity_2[groups_2]
+            max_popularity_1, max_popularity_2 = max_popularity_1[groups_1], max_popularity_2[groups_2]
+            max_unpop = np.where(np.isnan(min_popularity_1) | np.isnan(min_popularity_2), -np.inf, 1 - np.minimum(min_popularity_1, min_popularity_2))
+            min_unpop = np.where(np.isnan(max_popularity_1) | np.isnan(max_popularity_2), -np.inf, 1 - np.minimum(max_popularity_1, max_popularity_2))
+            max_shortness = 2/(min_length_1[groups_1] + min_length_2[groups_2])
+            min_shortness = 2/(max_length_1[groups_1] + max_length_2[groups_2])
+
+            bounds = (rar_w*(max_rar if rar_w >= 0 else min_rar) + unpop_w*(max_unpop if unpop_w >= 0 else min_unpop) +
+                      shortness_w*(max_shortness if shortness_w >= 0 else min_shortness))
+        return np.where(np.isnan(bounds), np.inf, bounds)
+
+    def scores(self, rows_1, rows_2, functions, names, rar_w, unpop_w, shortness_w):
+        """Interestingness of the segues with nodes in rows_1 and rows_2, and compare functions, as arrays.
+
+        Args:
+            rows_1 (np.array): rows of the nodes n1
+            rows_2 (np.array): rows of the nodes n2
+            functions (np.array): compare functions, as positions in names
+            names (list): names of the compare functions
+            rar_w, unpop_w, shortness_w (float): see interestingness
+
+        Returns:
+            np.array
+        """
+        length, popularity, trace = self.arrays()
+        if len(rows_1) == 0:
+            return np.zeros(0)
+
+        # The rarity is looked up once per distinct segue type: trace of n1, compare function, trace of n2
+        n_traces = len(self.traces)
+        types, type_ids = np.unique((trace[rows_1] * len(names) + functions) * n_traces + trace[rows_2], return_inverse=True)
+        rar = np.zeros(len(types))
+        for idx, t in enumerate(types.tolist()):
+            t, trace_2 = divmod(t, n_traces)
+            trace_1, f = divmod(t, len(names))
+            segue_type = self.traces[trace_1] + (names[f],) + self.traces[trace_2][::-1]
+            rar[idx] = self.count['segue_type_rarity'].get(segue_type, -np.inf)
+        rar = rar[type_ids.reshape(-1)]
+
+        min_popularity = np.minimum(popularity[rows_1], popularity[rows_2])
+        with np.errstate(invalid='ignore'):
+            unpop = np.where(np.isnan(min_popularity), -np.inf, 1 - min_popularity)
+            shortness = 2/(length[rows_1] + length[rows_2])
+            return rar_w*rar + unpop_w*unpop + shortness_w*shortness
+
+
+@timed_phase('segues')
+def interestingness_array(segues, rar_w, unpop_w, shortness_w, columns=None):
+    """As interestingness, returning an array.
+
+    Args:
+        segues (list): segues, None elements score 0
+        columns (NodeColumns, optional): columns to reuse across calls. If None, new ones
+        Others: see interestingness
+
+    Returns:
+        np.array
+    """
+    columns = NodeColumns() if columns is None else columns
+    given = [idx for idx, segue in enumerate(segues) if segue is not None]
+    rows_1 = np.array([columns.row(segues[idx]['n1']) for idx in given], dtype=np.int64)
+    rows_2 = np.array([columns.row(segues[idx]['n2']) for idx in given], dtype=np.int64)
+
+    function_ids = {}
+    functions = np.array([function_ids.setdefault(segues[idx]['compare_function'], len(function_ids)) for idx in given], dtype=np.int64)
+
+    scores = np.zeros(len(segues))
+    scores[given] = columns.scores(rows_1, rows_2, functions, list(function_ids), rar_w, unpop_w, shortness_w)
+    return scores
+
+
+@timed_phase('segues')
+def interestingness_matrix(segues_all_pairs, interestingness_weights, columns=None):
+    """Interestingness of the segues between all the couples of songs of a playlist.
+
+    Args:
+        segues_all_pairs (dict or CompactSegues): (i, j) -> list of segues, as returned by all_segues.
+                                                  The segues of a CompactSegues are scored from their rows, without views
+        interestingness_weights (dict): weights of interestingness, e.g. as returned by best_interestingness_weights
+        columns (NodeColumns, optional): see interestingness_array
+
+    Returns:
+        dict: (i, j) -> array of the scores of the segues of (i, j), in the same order
+    """
+    columns = NodeColumns() if columns is None else columns
+    if not isinstance(segues_all_pairs, CompactSegues):
+        return {couple: interestingness_array(segues, **interestingness_weights, columns=columns) for couple, segues in segues_all_pairs.items()}
+
+    # The segues of all the couples are scored in a single batch
+    couples = list(segues_all_pairs.rows)
+    rows = np.concatenate([segues_all_pairs.rows[couple] for couple in couples] + [np.zeros((0, 6), dtype=np.int32)]).astype(np.int64)
+    tree_rows = [columns.tree_rows(g) for g in segues_all_pairs.I]
+    offsets = np.cumsum([0] + [len(tree_rows[i]) for i in range(len(tree_rows) - 1)])
+    all_tree_rows = np.concatenate(tree_rows + [np.zeros(0, dtype=np.int64)])
+
+    scores = columns.scores(all_tree_rows[offsets[rows[:, 0]] + rows[:, 1]], all_tree_rows[offsets[rows[:, 2]] + rows[:, 3]],
+                            rows[:, 4], segues_all_pairs.compare_functions.values, **interestingness_weights)
+    bounds = np.cumsum([len(segues_all_pairs.rows[couple]) for couple in couples])[:-1]
+    return dict(zip(couples, np.split(scores, bounds)))
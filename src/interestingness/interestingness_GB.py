@@ -8,10 +8,12 @@ from src.utils.utils_ngx_graph import father
 from src.knowledge_graph.walk_graph import find_segues
 from collections import defaultdict
 import numpy as np
+import hashlib
 from src.knowledge_graph.segues_filtering import nodes_types_to_filter_loose
 from src.knowledge_graph.merge_graphs import merge_graphs
-from src.features.used import *
+from src.features import registry
 from src.knowledge_graph.segue_type import segue_type
+from src.utils.timing import timed_phase
 
 """
     Our interstingness
@@ -26,7 +28,10 @@ def load_count_sample():
     if _count is None:
 
         with open(f"{data.preprocessed_dataset_path}/count_interestingness_GB.txt", 'rb') as f:
-            _count = pickle.load(f)
+            content = f.read()
+        _count = pickle.loads(content)
+        # Identifies the counts the path aggregates stored in the trees were computed with, see path_aggregates
+        _count['fingerprint'] = hashlib.sha1(content).hexdigest()
 
         # Normalize segue_type_rarity score, as all the values are too close to 1.
         # We apply a logarithm normalization, so we:
@@ -109,59 +114,73 @@ def rarity_score(segue):
         return -np.inf
 
 
-def unpopularity_score(segue):
-
-    def _popularity_node_to_source(node):
-        pop_i = []
-        while node['id'] != 'source':
+def path_aggregates(g):
+    """Aggregates of the root paths of the nodes of g, used by shortness_score and unpopularity_score.
+       They are computed once per tree, and stored in g.graph['path_aggregates'], together with the fingerprint
+       of the counts they depend on: they are computed again only if the counts change.
 
-            id_node = node['mergiable_id']
+    Args:
+        g (ngx graph)
 
-            if node['type'] in count['node']:
+    Returns:
+        dict: node id -> (number of edges not entailed, minimum popularity of the nodes but source,
+                          whether the type of some node but source is not in the counts)
+    """
+    count = load_count_sample()
+    stored = g.graph.get('path_aggregates')
+    if stored is None or stored[0] != count.get('fingerprint'):
+        aggregates = {}
+        # Nodes are visited in insertion order, so fathers come before their children
+        for k in g._node:
+            if k not in aggregates:
+                aggregates[k] = (0, np.inf, False)
+            length, popularity, unknown = aggregates[k]
 
-                try:
-                    node_edgeset = count['node'][node['type']][id_node]
-                except KeyError:
-                    node_edgeset = np.inf
+            for child, edge in g[k].items():
+                n = g._node[child]
+                if edge['generating_function'] == 'init':
+                    child_length = 1
+                else:
+                    child_length = length + (0 if is_entailed(edge['generating_function']) else 1)
 
-                meadian_edgeset_actual_type = count['node'][node['type']]['__meadian__']
-                pop_i.append(min(1, node_edgeset/meadian_edgeset_actual_type))
+                if n['type'] in count['node']:
+                    node_edgeset = count['node'][n['type']].get(n['mergiable_id'], np.inf)
+                    meadian_edgeset_actual_type = count['node'][n['type']]['__meadian__']
+                    aggregates[child] = (child_length, min(popularity, min(1, node_edgeset/meadian_edgeset_actual_type)), unknown)
+                else:
+                    aggregates[child] = (child_length, popularity, True)
 
-            else:
-                return None
+        g.graph['path_aggregates'] = (count.get('fingerprint'), aggregates)
+    return g.graph['path_aggregates'][1]
 
-            node = father(node)
 
-        return pop_i
+def _aggregates(node):
+    return path_aggregates(node['graph'])[node['id']]
 
-    count = load_count_sample()
 
-    pop_subpath_1 = _popularity_node_to_source(segue['n1'])
-    pop_subpath_2 = _popularity_node_to_source(segue['n2'])
-    if pop_subpath_1 is not None and pop_subpath_2 is not None:
-        min_popularity = min(pop_subpath_1+pop_subpath_2)
+def unpopularity_score(segue):
+    _, popularity_1, unknown_1 = _aggregates(segue['n1'])
+    _, popularity_2, unknown_2 = _aggregates(segue['n2'])
+    if not unknown_1 and not unknown_2:
+        min_popularity = min(popularity_1, popularity_2)
         unpopularity = 1 - min_popularity
     else:
         unpopularity = -np.inf
     return unpopularity
 
 
+def is_entailed(generating_function):
+    """Whether the feature named generating_function is entailed, i.e. it does not count in the length of segues"""
+    return generating_function in registry.entailed
+
+
 def shortness_score(segue):
-    length = 0
-    for node in [segue['n1'], segue['n2']]:
-        while True:
-            node_father = father(node)
-            generating_function = node['graph'][node_father['id']][node['id']]['generating_function']
-            if generating_function == 'init':
-                length += 1
-                break
-            func = getattr(globals()[generating_function], generating_function)
-            length += 1 if 'entailed' not in func.__annotations__ else 0
-            node = node_father
+    length = _aggregates(segue['n1'])[0] + _aggregates(segue['n2'])[0]
     shortness = 2/length
     return shortness
 
 
+@timed_phase('segues')
 def interestingness(segues, rar_w, unpop_w, shortness_w):
     scores = []
     for segue in segues:
@@ -0,0 +1,162 @@
+"""
+The k most interesting segues between songs, without scoring and filtering all their segues.
+
+The interestingness of a segue (see interestingness_GB) decomposes into quantities of its two nodes:
+
+* rarity: the segue type is the trace of n1, the compare function and the trace of n2 reversed;
+* unpopularity: the minimum popularity on the path is the minimum of the ones of the root paths of n1 and n2;
+* shortness: the length of the path is the sum of the ones of the root paths of n1 and n2.
+
+So they are computed once per node, see batch_interestingness. Candidates are found as find_segues does, in groups:
+the equal segues of a couple of merged root paths join every node one stands for with every node the other stands for.
+The interestingness of a group is bounded from the ranges of the three quantities over its nodes, at a cost linear
+in its nodes, and groups are pushed onto a heap by their bound. Popped groups are expanded into their segues,
+pushed back with their score, and segues are checked against the filters as they are popped, until k of them pass.
+Those beat the bounds of the groups still on the heap, which are never expanded.
+"""
+
+from src.knowledge_graph.walk_graph import _MergedRootPaths, _candidates, _join, _check_filters, find_segues, all_segues, get_segue_store
+from src.knowledge_graph.segues_filtering import pre, post, nodes_types_to_filter_strict
+from src.knowledge_graph.resolve_compare_function import get_dict
+from src.interestingness.batch_interestingness import NodeColumns, interestingness_array
+from src.utils.timing import timed_phase
+import heapq
+import itertools
+import numpy as np
+
+
+# Groups with fewer segues are scored one segue at a time, see NodeColumns.score
+_batch_size = 32
+
+
+def _key(score):
+    # Decreasing score. NaN scores, from null weights of infinite scores, come last
+    return -score if score == score else np.inf
+
+
+def _top(bounds, expand, k, interestingness_weights, pre_filtering, post_filtering, columns):
+    """The first k segues passing the filters, by decreasing interestingness, from groups of segues.
+
+    Args:
+        bounds (list): for every group, an upper bound of the interestingness of its segues
+        expand (function): group -> its segues. Groups, and their segues, are in the order of find_segues
+        Others: see find_top_segues
+
+    Returns:
+        list
+    """
+    # Entries are (key, group, position of the segue in the group), -1 for a group to expand.
+    # Ties keep the order of find_segues, and a group comes before its segues
+    heap = [(_key(bound), group, -1) for group, bound in enumerate(bounds)]
+    heapq.heapify(heap)
+
+    expanded = {}
+    top = []
+    while heap and len(top) < k:
+        _, group, position = heapq.heappop(heap)
+        if position < 0:
+            segues = expand(group)
+            if len(segues) < _batch_size:
+                scores = [columns.score(columns.row(segue['n1']), columns.row(segue['n2']), segue['compare_function'], **interestingness_weights)
+                          for segue in segues]
+            else:
+                scores = interestingness_array(segues, **interestingness_weights, columns=columns).tolist()
+            expanded[group] = (segues, scores)
+            for position, score in enumerate(scores):
+                heapq.heappush(heap, (_key(score), group, position))
+        else:
+            segues, scores = expanded[group]
+            if _check_filters(segues[position], pre_filtering, post_filtering):
+                segues[position]['interestingness'] = scores[position]
+                top.append(segues[position])
+    return top
+
+
+def _path_ranges(g, t, columns):
+    """Ranges of the columns over the nodes every merged root path of t stands for, see NodeColumns.ranges"""
+    position = {k: idx for idx, k in enumerate(g._node)}
+    rows = columns.tree_rows(g)[[position[k] for nodes in t.nodes for k in nodes]]
+    starts = np.cumsum([0] + [len(nodes) for nodes in t.nodes[:-1]])
+    return columns.ranges(rows, starts)
+
+
+def _top_joined(g1, t1, r1, g2, t2, r2, candidates, k, interestingness_weights, pre_filtering, post_filtering,
+                nodes_types_to_segue_not_equal, columns):
+    """_top of the segues _join finds, unchecked, with a group for the equal segues of every couple of root paths in candidates.
+       The segues of the other compare functions form the last group: they are found by comparing nodes, so they are not bounded
+    """
+    bounds = columns.bounds(r1, np.array([p1 for p1, _ in candidates], dtype=np.int64), r2, np.array([p2 for _, p2 in candidates], dtype=np.int64),
+                            'equal', **interestingness_weights).tolist()
+    if len(nodes_types_to_segue_not_equal) > 0:
+        bounds.append(np.inf)
+
+    def expand(group):
+        if group < len(candidates):
+            return _join(g1, t1, g2, t2, [candidates[group]], pre_filtering, post_filtering, {}, check=False)
+        return _join(g1, t1, g2, t2, [], pre_filtering, post_filtering, nodes_types_to_segue_not_equal, check=False)
+
+    return _top(bounds, expand, k, interestingness_weights, pre_filtering, post_filtering, columns)
+
+
+@timed_phase('segues')
+def find_top_segues(g1, g2, k, interestingness_weights, pre_filtering=pre, post_filtering=post, nodes_types_to_filter=nodes_types_to_filter_strict,
+                    nodes_types_to_segue_not_equal=get_dict()):
+    """The k most interesting segues from g1 to g2.
+
+    Args:
+        g1 (ngx graph)
+        g2 (ngx graph)
+        k (int): number of segues
+        interestingness_weights (dict): weights of interestingness, e.g. as returned by best_interestingness_weights
+        Others: see find_segues
+
+    Returns:
+        list: at most k segues of find_segues(g1, g2), by decreasing interestingness, stored in their key 'interestingness'
+    """
+    if get_segue_store() is not None:
+        # Segues are read from the store, filtered already
+        segues = find_segues(g1, g2, pre_filtering, post_filtering, nodes_types_to_filter, nodes_types_to_segue_not_equal)
+        return _top([np.inf], lambda _: segues, k, interestingness_weights, None, None, NodeColumns())
+
+    columns = NodeColumns()
+    columns.tree_rows(g1)
+    columns.tree_rows(g2)
+    t1 = _MergedRootPaths(g1, nodes_types_to_filter)
+    t2 = _MergedRootPaths(g2, nodes_types_to_filter)
+    candidates = [(p1, p2) for p1 in range(1, len(t1.last)) if not t1.filtered[p1] for p2 in t2.ending_in.get(t1.last[p1], [])]
+
+    return _top_joined(g1, t1, _path_ranges(g1, t1, columns), g2, t2, _path_ranges(g2, t2, columns), candidates, k, interestingness_weights,
+                       pre_filtering, post_filtering, nodes_types_to_segue_not_equal, columns)
+
+
+@timed_phase('segues')
+def all_top_segues(I, k, interestingness_weights, pre_filtering=pre, post_filtering=post, nodes_types_to_filter=nodes_types_to_filter_strict,
+                   nodes_types_to_segue_not_equal=get_dict()):
+    """The k most interesting segues between all the ordered couples of the trees in I, found as all_segues does.
+
+    Args:
+        I (list): list of trees
+        Others: see find_top_segues
+
+    Returns:
+        dict: (i, j) -> find_top_segues(I[i], I[j], k, interestingness_weights), for every i != j
+    """
+    columns = NodeColumns()
+    if get_segue_store() is not None:
+        # Segues are read from the store, filtered already
+        stored = all_segues(I, pre_filtering, post_filtering, nodes_types_to_filter, nodes_types_to_segue_not_equal)
+        return {couple: _top([np.inf], lambda _, segues=segues: segues, k, interestingness_weights, None, None, columns)
+                for couple, segues in stored.items()}
+
+    # Rows are added before the ranges are taken, so that the columns are turned into arrays once
+    for g in I:
+        columns.tree_rows(g)
+    tries = [_MergedRootPaths(g, nodes_types_to_filter) for g in I]
+    ranges = [_path_ranges(g, t, columns) for g, t in zip(I, tries)]
+    candidates = _candidates(tries)
+
+    segues = {}
+    for i, j in itertools.permutations(range(len(I)), 2):
+        segues[(i, j)] = _top_joined(I[i], tries[i], ranges[i], I[j], tries[j], ranges[j], sorted(candidates.get((i, j), [])), k,
+                                     interestingness_weights, pre_filtering, post_filtering, nodes_types_to_segue_not_equal, columns)
+    return segues
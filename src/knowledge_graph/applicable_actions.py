@@ -1,20 +1,36 @@
-from src.features.used import *
 from src.features import used
-from inspect import signature, Parameter
+from src.features import registry
 import itertools
 from src.utils.utils_ngx_graph import father
-from src.features.inspector import in_node_types, out_node_types, edge_types
+from src.features.inspector import out_node_types, edge_types
+from src.features import stats
 from unittest.mock import MagicMock
 import re
 
 
+# Features that are applied to a synset only if it directly discends from a word
+features_applied_to_word_synsets = set(['entailment', 'member_holonyms', 'member_meronyms', 'part_holonyms', 'part_meronyms',
+                                        'substance_holonyms', 'substance_meronyms', 'synset_also_sees', 'synset_attributes',
+                                        'synset_similar_tos', 'synset_verb_groups', 'hypernyms', 'hyponyms'])
+
+# Nodes generated by these features are not expanded any further
+features_not_expanded = set(['artist_relationships'])
+
+
 class ActionsSupplier:
 
     """Class thought as a supplier of functions that allows to build the graph for an entity.
        Therefore, handles the functions that were already supplied (avoiding repetitions),
        considers recursive functions, ..
+
+       Entailed features (year, month, .. from a date, award_year, .. from an award, word from a token phrase)
+       are fused: when a node is added, construct_graph attaches its whole entailed closure in the same step,
+       instead of waiting for the next rounds. See fused_actions.
     """
 
+    # Whether the entailed, local, single-argument features are fused, see fused_actions
+    fuse_entailed = True
+
     def __init__(self):
         # This set contains the functions already applied. It is formed by a set of tuples. Each tuple contains (key1, ... keyn, key1~function),
         # where keyi are the nodes which we used as argument for the function and function is the name of the function applied.
@@ -35,26 +51,33 @@ class ActionsSupplier:
             for i, j in zip(idxs, idxs[1:]):
                 self.applied_actions.add((node[:i], node[:j]))
 
+        # Index of the nodes of g, used to match features incrementally.
+        # - functions: the eligible features, with their signatures;
+        # - args_of_type: for every node type, the (feature, argument position) it can be fed to;
+        # - eligible_nodes: for every feature, for every argument, the keys of the eligible nodes, in the order they were added to g;
+        # - order: for every indexed node key, its position in the insertion order of g;
+        # - n_indexed: how many nodes of g (in insertion order) were already indexed, the others form the frontier.
+        self.functions = [registry.functions[f] for f in self.eligible_actions()]
+        self.signatures = {func.__name__: registry.signatures[func.__name__] for func in self.functions}
+        self.args_of_type = {t: [(registry.functions[f], idx) for f, idx in l if f in self.signatures] for t, l in registry.args_of_type.items()}
+        self.eligible_nodes = {func.__name__: [[] for _ in registry.args[func.__name__]] for func in self.functions}
+        self.order = {}
+        self.n_indexed = 0
+
+        # For every node type, the fused features it can be fed to
+        fused = set(name for name in self.signatures if self.fuse_entailed and name in registry.entailed and
+                    name not in registry.remote and len(registry.args[name]) == 1)
+        self.fused_of_type = {t: [(func, idx) for func, idx in l if func.__name__ in fused] for t, l in self.args_of_type.items()}
+
     def eligible_nodes_filter(self, node, func):
         """Used to eventually filter out nodes that would otherwise be considered as applicable to some features.
         Useful to limit the graph growth.
 
         Active filters:
         -avoid infinite loops
-        -do not expand nodes that originate from an artist relationship
-        -if the feature is entailment, then apply to a synset only if it directly discend from a word
-        -if the feature is member_holonyms, then apply to a synset only if it directly discend from a word
-        -if the feature is member_meronyms, then apply to a synset only if it directly discend from a word
-        -if the feature is part_holonyms, then apply to a synset only if it directly discend from a word
-        -if the feature is part_meronyms, then apply to a synset only if it directly discend from a word
-        -if the feature is substance_holonyms, then apply to a synset only if it directly discend from a word
-        -if the feature is substance_meronyms, then apply to a synset only if it directly discend from a word
-        -if the feature is synset_also_sees, then apply to a synset only if it directly discend from a word
-        -if the feature is synset_attributes, then apply to a synset only if it directly discend from a word
-        -if the feature is synset_similar_tos, then apply to a synset only if it directly discend from a word
-        -if the feature is synset_verb_groups, then apply to a synset only if it directly discend from a word
-        -if the feature is hypernyms, then apply to a synset only if it directly discend from a word
-        -if the feature is hyponyms, then apply to a synset only if it directly discend from a word
+        -do not expand nodes that originate from a feature in features_not_expanded, i.e. an artist relationship
+        -if the feature is in features_applied_to_word_synsets (entailment, hypernyms, hyponyms, ...),
+         then apply to a synset only if it directly discend from a word
 
         Args:
             node (ngx Node): The eligible node to keep or filter out
@@ -63,25 +86,56 @@ class ActionsSupplier:
         Returns:
             Bool: True if keep it, False if discard it
         """
+        father_node = father(node)
+        generating_function = self.g[father_node['id']][node['id']]['generating_function']
+
         # a => b is equivalent to not a or b
-        if self.g[father(node)['id']][node['id']]['generating_function'] != func.__name__ and \
-                self.g[father(node)['id']][node['id']]['generating_function'] != 'artist_relationships' and \
-                (not func.__name__ == 'entailment' or father(node)['type'] == 'word') and \
-                (not func.__name__ == 'member_holonyms' or father(node)['type'] == 'word') and \
-                (not func.__name__ == 'member_meronyms' or father(node)['type'] == 'word') and \
-                (not func.__name__ == 'part_holonyms' or father(node)['type'] == 'word') and \
-                (not func.__name__ == 'part_meronyms' or father(node)['type'] == 'word') and \
-                (not func.__name__ == 'substance_holonyms' or father(node)['type'] == 'word') and \
-                (not func.__name__ == 'substance_meronyms' or father(node)['type'] == 'word') and \
-                (not func.__name__ == 'synset_also_sees' or father(node)['type'] == 'word') and \
-                (not func.__name__ == 'synset_attributes' or father(node)['type'] == 'word') and \
-                (not func.__name__ == 'synset_similar_tos' or father(node)['type'] == 'word') and \
-                (not func.__name__ == 'synset_verb_groups' or father(node)['type'] == 'word') and \
-                (not func.__name__ == 'hypernyms' or father(node)['type'] == 'word') and \
-                (not func.__name__ == 'hyponyms' or father(node)['type'] == 'word'):
-            return True
-        else:
-            return False
+        return generating_function != func.__name__ and \
+            generating_function not in features_not_expanded and \
+            (func.__name__ not in features_applied_to_word_synsets or father_node['type'] == 'word')
+
+    def index_frontier(self):
+        """Index the nodes added to the graph since the last call, i.e. the frontier.
+
+        Every node of the frontier is checked, only once, against the arguments of the features it could be fed to.
+
+        Returns:
+            dict: For every feature with at least one new eligible node, a list with, for every argument, the keys of the new eligible nodes
+        """
+        frontier = {}
+        for k in itertools.islice(self.g._node, self.n_indexed, None):
+            self.order[k] = len(self.order)
+            node = self.g._node[k]
+            for func, idx in self.args_of_type.get(node['type'], []):
+                if self.eligible_nodes_filter(node, func):
+                    self.eligible_nodes[func.__name__][idx].append(k)
+                    if func.__name__ not in frontier:
+                        frontier[func.__name__] = [[] for _ in self.eligible_nodes[func.__name__]]
+                    frontier[func.__name__][idx].append(k)
+        self.n_indexed = len(self.order)
+        return frontier
+
+    def fused_actions(self, keys):
+        """Actions of the fused features applicable to the nodes keys, marked as applied,
+        so that applicable_actions does not supply them again.
+
+        Fused features are the eligible features which are entailed, local and with a single argument:
+        their values follow from the node they are applied to, they are cheap,
+        and they can be applied as soon as the node is added.
+
+        Args:
+            keys (list): keys of nodes of the graph
+
+        Returns:
+            list -- List containing [(func, (key,), func_signature), ...], as applicable_actions
+        """
+        l = []
+        for k in keys:
+            node = self.g._node[k]
+            for func, idx in self.fused_of_type.get(node['type'], []):
+                if self.eligible_nodes_filter(node, func):
+                    l += self.filter_applied_actions(func, [(k,)])
+        return l
 
     def applicable_actions(self):
         """Apply the function below to all the function in the folder
@@ -91,29 +145,56 @@ class ActionsSupplier:
         match a valid value to every field of the functions.
         If not function is found, this way, allow default values as well.
 
+        Without default values, only the combinations of nodes including at least one node of the frontier are considered,
+        as all the others were already supplied in former calls. So the cost of a call is proportional to the frontier, not to the graph.
+
         Returns:
             list -- The concatenation of all the lists returned for any of the function in the folder
         """
 
         # Without default values
         l = []
-        functions = self.eligible_actions()
-        for f in functions:
-            # Get the argument variables name for the function f
-            func = getattr(globals()[f], f)
-            l += self.applicable_actions_given_function(func, False)
+        frontier = self.index_frontier()
+        for func in self.functions:
+            if func.__name__ in frontier:
+                l += self.applicable_actions_given_frontier(func, frontier[func.__name__])
 
         if len(l) > 0:
             return l
         else:
             # With default values
             l = []
-            for f in functions:
-                # Get the argument variables name for the function f
-                func = getattr(globals()[f], f)
+            for func in self.functions:
                 l += self.applicable_actions_given_function(func, True)
             return l
 
+    def applicable_actions_given_frontier(self, func, new_nodes):
+        """Finds all the combination of nodes that can be applied as arguments of the function func,
+        and that include at least one node of the frontier.
+
+        A combination is counted once, as it is built with the first new node it contains in position i,
+        old nodes before i and any node after i.
+        Combinations are returned in the same order itertools.product would give on the whole graph.
+
+        Arguments:
+            func {function} --
+            new_nodes {list} -- For every argument of func, the keys of the new eligible nodes
+
+        Returns:
+            list -- List containing [(func, (key1, .. keyn), func_signature), ...], as applicable_actions_given_function
+        """
+        eligible_nodes = self.eligible_nodes[func.__name__]
+
+        possible_args = []
+        for i in range(len(eligible_nodes)):
+            if len(new_nodes[i]) > 0:
+                # New nodes are the last ones to be added to the eligible nodes
+                old_nodes = [e[:len(e)-len(n)] for e, n in zip(eligible_nodes[:i], new_nodes[:i])]
+                possible_args += itertools.product(*old_nodes, new_nodes[i], *eligible_nodes[i+1:])
+        possible_args.sort(key=lambda arg: [self.order[k] for k in arg])
+
+        return self.filter_applied_actions(func, possible_args)
+
     def applicable_actions_given_function(self, func, allow_default_values):
         """Finds all the possible combination of nodes in the graph that can be
         applied as arguments of the function func.
@@ -133,29 +214,19 @@ class ActionsSupplier:
             list -- List containing [(func, (key1, .. keyn), func_signature), ...] where func is the function to apply
                     and the tuple contain the key of the graph nodes to consider as parameters of the function
         """
-        sig = signature(func)
+        defaults = registry.defaults[func.__name__]
 
-        # Find key of nodes with type equal to the type(s) associated to each function argument
+        # Key of nodes with type equal to the type(s) associated to each function argument, as indexed
         # The function argument type is either annotated, or, otherwise, we consider it to be the argument name
         feature_args_eligible_nodes = []
-        for arg, v in sig.parameters.items():
-
-            eligible_types_arg = in_node_types(func)[arg]
-            eligible_nodes = []
-
-            for k in self.g.nodes():
-                node = self.g.nodes()[k]
-                if node['type'] in eligible_types_arg:
-
-                    if self.eligible_nodes_filter(node, func):
-                        eligible_nodes.append(k)
+        for eligible_nodes, arg in zip(self.eligible_nodes[func.__name__], registry.args[func.__name__]):
 
             # If:
             # - default values are allowed AND
             # - no other eligible nodes are available AND
             # - the params allows default values THEN
             # we append a particular node, indicating that the param of the function can be used with its default value
-            if allow_default_values and len(eligible_nodes) == 0 and v.default is not Parameter.empty:
+            if allow_default_values and len(eligible_nodes) == 0 and arg in defaults:
                 feature_args_eligible_nodes.append(['DEFAULTVALUE'])
             else:
                 feature_args_eligible_nodes.append(eligible_nodes)
@@ -164,7 +235,12 @@ class ActionsSupplier:
         # Remark: if at least one of them is empty, no possible args will be available
         possible_args = list(itertools.product(*feature_args_eligible_nodes))
 
-        # Filter combination based on if I have already applied that function to that keys
+        return self.filter_applied_actions(func, possible_args)
+
+    def filter_applied_actions(self, func, possible_args):
+        """Filter combination based on if I have already applied that function to that keys,
+        and store the remaining ones together with the already applied ones.
+        """
         filtered_args = []
         for arg in possible_args:
             if arg + (f"{arg[0]}~{func.__name__}",) not in self.applied_actions:
@@ -173,6 +249,7 @@ class ActionsSupplier:
                 # Store the actual function together with the already applied ones
                 self.applied_actions.add(arg + (f"{arg[0]}~{func.__name__}",))
 
+        sig = self.signatures[func.__name__]
         return [(func, arg, sig) for arg in filtered_args]
 
 
@@ -182,6 +259,9 @@ class MockedActionsSupplier(ActionsSupplier):
        Useful for testing and debugging, to construct a graph where no calls and feature computations are needed
     """
 
+    # Mocked functions are supplied by applicable_actions only
+    fuse_entailed = False
+
     def applicable_actions(self):
         actions = super(MockedActionsSupplier, self).applicable_actions()
 
@@ -240,3 +320,44 @@ class InformativeActionSupplier(ActionsSupplier):
 
     def eligible_actions(self):
         return list(set(used.__all__)-set(['token_phrase']))
+
+
+class CostAwareActionsSupplier(ActionsSupplier):
+
+    """Orders the actions of a round by expected segue yield per second of cost, as measured by src.features.stats.
+       With max_cost, the actions are dropped once the expected cost of the ones supplied for the graph exceeds max_cost seconds.
+    """
+
+    # Tells construct_graph not to re-order the actions breadth-first when the construction has a budget
+    orders_actions = True
+
+    def __init__(self, max_cost=None):
+        """
+        Args:
+            max_cost (float, optional): Maximum expected cost, in seconds, of the actions supplied for a graph. If None, no maximum
+        """
+        super(CostAwareActionsSupplier, self).__init__()
+        self.max_cost = max_cost
+        self.cost = 0.0
+
+    def applicable_actions(self):
+        actions = super(CostAwareActionsSupplier, self).applicable_actions()
+        if len(actions) == 0:
+            return actions
+
+        all_stats = stats.feature_stats()
+        names = set(action[0].__name__ for action in actions)
+        value = {name: stats.expected_yield_per_second(name, all_stats) for name in names}
+        actions = sorted(actions, key=lambda action: -value[action[0].__name__])
+
+        if self.max_cost is None:
+            return actions
+
+        kept = []
+        for action in actions:
+            cost = stats.expected_latency(action[0].__name__, all_stats)
+            if self.cost + cost > self.max_cost:
+                continue
+            self.cost += cost
+            kept.append(action)
+        return kept
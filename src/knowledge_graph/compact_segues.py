@@ -0,0 +1,188 @@
+"""
+Compact representation of the segues between the couples of songs of a playlist.
+
+A segue is a dictionary holding its nodes, its value, compare function and any other field. Kept for a whole experiment,
+e.g. in the d_segues of hill_climbing, segues take most of the memory. CompactSegues stores the segues of every couple
+as the rows of an array of integers: (tree, node position, tree, node position, compare function, payload), where trees
+are positions in the playlist, nodes are positions in order of insertion in their tree, compare functions and payloads
+(the fields of the segue but its nodes) are positions in tables of distinct values.
+
+SegueView turns a row back into an object behaving like the dictionary of the segue, as CompactNode does for nodes,
+and SegueView.copy into the dictionary itself, e.g. for rendering.
+"""
+
+from src.knowledge_graph.compact_tree import _Table
+from src.utils.timing import timed_phase
+import numpy as np
+
+# Columns of the rows of CompactSegues
+_columns = 6
+
+
+class SegueView():
+
+    """Light-weight view on a segue of CompactSegues, that behaves like the dictionary of the segue.
+       Fields set on the view (e.g. the cached interestingness of hill_climbing) are stored in CompactSegues, for that segue.
+    """
+
+    __slots__ = ('segues', 'couple', 'k')
+
+    def __init__(self, segues, couple, k):
+        self.segues = segues
+        self.couple = couple
+        self.k = k
+
+    def _row(self):
+        return self.segues.rows[self.couple][self.k]
+
+    def _fields(self):
+        s = self.segues
+        return s.payloads.values[self._row()[5]] + tuple(s.annotations.get(self.couple, {}).get(self.k, {}).items())
+
+    def __getitem__(self, key):
+        s = self.segues
+        row = self._row()
+        if key == 'n1':
+            return s.node(row[0], row[1])
+        elif key == 'n2':
+            return s.node(row[2], row[3])
+        elif key == 'compare_function':
+            return s.compare_functions.values[row[4]]
+        annotations = s.annotations.get(self.couple, {}).get(self.k)
+        if annotations is not None and key in annotations:
+            return annotations[key]
+        for k, v in s.payloads.values[row[5]]:
+            if k == key:
+                return v
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in ['n1', 'n2', 'compare_function']:
+            raise KeyError(f"{key} of a compact segue cannot be changed")
+        self.segues.annotations.setdefault(self.couple, {}).setdefault(self.k, {})[key] = value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        keys = ['n1', 'n2']
+        for k, _ in self._fields():
+            if k not in keys:
+                keys.append(k)
+        return keys
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def copy(self):
+        """The dictionary of the segue, as returned by find_segues"""
+        return dict(self.items())
+
+    def __eq__(self, other):
+        return isinstance(other, SegueView) and self.segues is other.segues and self.couple == other.couple and self.k == other.k
+
+    def __hash__(self):
+        return hash((id(self.segues), self.couple, self.k))
+
+    def __repr__(self):
+        return repr(self.copy())
+
+
+class CompactSegues():
+
+    """Mapping (i, j) -> segues from I[i] to I[j], as returned by all_segues, stored compactly.
+       Lists of segues can be set for a couple, and are returned as lists of SegueView.
+    """
+
+    def __init__(self, I):
+        """
+        Args:
+            I (list): list of trees
+        """
+        self.I = I
+        self._ids = [None] * len(I)
+        self._index = [None] * len(I)
+        self.compare_functions = _Table()
+        self.payloads = _Table()
+        # (i, j) -> array of rows, one per segue
+        self.rows = {}
+        # couple -> k -> fields set on the view of the k-th segue of couple
+        self.annotations = {}
+
+    def _positions(self, i):
+        if self._ids[i] is None:
+            self._ids[i] = list(self.I[i]._node)
+            self._index[i] = {n: p for p, n in enumerate(self._ids[i])}
+        return self._index[i]
+
+    def node(self, i, p):
+        """Node in position p of I[i]"""
+        self._positions(i)
+        return self.I[i]._node[self._ids[i][p]]
+
+    def add_records(self, couple, records):
+        """Set the segues of a couple, given as records made by segue_matrix.segue_record"""
+        i, j = couple
+        index_1 = self._positions(i)
+        index_2 = self._positions(j)
+
+        rows = []
+        for id_1, id_2, fields in records:
+            rows.extend((i, index_1[id_1], j, index_2[id_2], self.compare_functions.add(fields['compare_function']),
+                         self.payloads.add(tuple(fields.items()))))
+        self.rows[couple] = np.array(rows, dtype=np.int32).reshape(-1, _columns)
+        self.annotations.pop(couple, None)
+
+    def __setitem__(self, couple, segues):
+        self.add_records(couple, [(segue['n1']['id'], segue['n2']['id'], {k: v for k, v in segue.items() if k != 'n1' and k != 'n2'})
+                                  for segue in segues])
+
+    def __getitem__(self, couple):
+        return [SegueView(self, couple, k) for k in range(len(self.rows[couple]))]
+
+    def __contains__(self, couple):
+        return couple in self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def keys(self):
+        return self.rows.keys()
+
+    def items(self):
+        return [(couple, self[couple]) for couple in self.rows]
+
+
+@timed_phase('segues')
+def compact_segues(I, segues_all_pairs):
+    """Compact form of the segues between the couples of trees in I.
+
+    Args:
+        I (list): list of trees
+        segues_all_pairs (dict): (i, j) -> list of segues, as returned by all_segues
+
+    Returns:
+        CompactSegues
+    """
+    segues = CompactSegues(I)
+    for couple, l in segues_all_pairs.items():
+        segues[couple] = l
+    return segues
@@ -0,0 +1,424 @@
+"""
+Compact, array-backed representation of the trees built by construct_graph.
+
+Song trees are strict trees: every node but source has exactly one father. CompactTree stores them as arrays indexed
+by node position (in order of insertion): the position of the father, and the positions of type, value,
+edge type and generating function in per-tree tables of distinct values. Ids are not stored, since the id of a node is
+the id of its father plus a suffix (e.g. `~artist_genres-1`), and are rebuilt only when needed.
+
+CompactTree and CompactNode expose the subset of the networkx API used on trees across the project
+(g.nodes()[id], g[id_1][id_2], g.predecessors, g.successors, node['type'], node['graph'], ..),
+so that functions like father, segue_type, find_segues and the filters work on both representations.
+
+save_trees writes the arrays of many trees into a single .npy file, that load_trees maps in memory: processes loading
+the same file share the pages of the arrays, instead of holding a copy each.
+"""
+
+import numpy as np
+import pickle
+
+# Per-node arrays of CompactTree, as the rows saved by save_trees
+_arrays = ['parent', 'suffix_idx', 'type_idx', 'value_idx', 'edge_type_idx', 'function_idx']
+
+
+class CompactNode():
+
+    """Light-weight view on a node of a CompactTree, that behaves like the node dictionary of networkx."""
+
+    __slots__ = ('tree', 'i')
+
+    def __init__(self, tree, i):
+        self.tree = tree
+        self.i = i
+
+    def __getitem__(self, key):
+        t = self.tree
+        i = self.i
+        if key == 'type':
+            return t.types[t.type_idx[i]]
+        elif key == 'value':
+            return t.values[t.value_idx[i]]
+        elif key == 'id':
+            return t.ids[i]
+        elif key == 'graph':
+            return t
+        elif key == 'mergiable_id' and i != 0:
+            return t.mergiable_id(i)
+        elif i in t.extras and key in t.extras[i]:
+            return t.extras[i][key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        k = ['value', 'type', 'id', 'graph'] + list(self.tree.extras.get(self.i, {}).keys())
+        return k + ['mergiable_id'] if self.i != 0 else k
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def copy(self):
+        return dict(self.items())
+
+    def father(self):
+        p = self.tree.parent[self.i]
+        return CompactNode(self.tree, p) if p >= 0 else None
+
+    def __eq__(self, other):
+        return isinstance(other, CompactNode) and self.tree is other.tree and self.i == other.i
+
+    def __hash__(self):
+        return hash((id(self.tree), self.i))
+
+    def __repr__(self):
+        return repr({k: v for k, v in self.items() if k != 'graph'})
+
+
+class _NodesView():
+
+    """Mapping id -> CompactNode, callable like networkx's g.nodes"""
+
+    __slots__ = ('tree',)
+
+    def __init__(self, tree):
+        self.tree = tree
+
+    def __call__(self, data=False):
+        if data:
+            return [(n, CompactNode(self.tree, i)) for i, n in enumerate(self.tree.ids)]
+        return self
+
+    def __getitem__(self, n):
+        return CompactNode(self.tree, self.tree.index[n])
+
+    def __contains__(self, n):
+        return n in self.tree.index
+
+    def __iter__(self):
+        return iter(self.tree.ids)
+
+    def __len__(self):
+        return len(self.tree.parent)
+
+
+class _AdjacencyView():
+
+    """Mapping child id -> edge attributes, of the children of a node"""
+
+    __slots__ = ('tree', 'i')
+
+    def __init__(self, tree, i):
+        self.tree = tree
+        self.i = i
+
+    def __getitem__(self, child):
+        t = self.tree
+        c = t.index[child]
+        if t.parent[c] != self.i:
+            raise KeyError(child)
+        return t.edge(c)
+
+    def __contains__(self, child):
+        c = self.tree.index.get(child)
+        return c is not None and self.tree.parent[c] == self.i
+
+    def __iter__(self):
+        ids = self.tree.ids
+        return (ids[c] for c in self.tree.children(self.i))
+
+    def __len__(self):
+        return len(self.tree.children(self.i))
+
+    def items(self):
+        return [(self.tree.ids[c], self.tree.edge(c)) for c in self.tree.children(self.i)]
+
+
+class CompactTree():
+
+    """Array-backed tree. Build it from a networkx tree with compact_tree."""
+
+    def __init__(self, parent, suffixes, suffix_idx, types, type_idx, values, value_idx,
+                 edge_types, edge_type_idx, functions, function_idx, extras, graph=None):
+        self.parent = parent
+        self.suffixes = suffixes
+        self.suffix_idx = suffix_idx
+        self.types = types
+        self.type_idx = type_idx
+        self.values = values
+        self.value_idx = value_idx
+        self.edge_types = edge_types
+        self.edge_type_idx = edge_type_idx
+        self.functions = functions
+        self.function_idx = function_idx
+        # Node position -> dictionary of additional attributes, e.g. pos_tag, only for nodes which have some
+        self.extras = extras
+        self.graph = {} if graph is None else graph
+        self._reset_caches()
+
+    def _reset_caches(self):
+        self._ids = None
+        self._index = None
+        self._children = None
+        self._mergiable_ids = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for k in ['_ids', '_index', '_children', '_mergiable_ids']:
+            state.pop(k)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset_caches()
+
+    @property
+    def ids(self):
+        if self._ids is None:
+            ids = []
+            for i in range(len(self.parent)):
+                suffix = self.suffixes[self.suffix_idx[i]]
+                p = self.parent[i]
+                ids.append(suffix if p <= 0 else ids[p] + suffix)
+            self._ids = ids
+        return self._ids
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = {n: i for i, n in enumerate(self.ids)}
+        return self._index
+
+    def children(self, i):
+        """Positions of the children of the node in position i, in order of insertion"""
+        if self._children is None:
+            order = np.argsort(self.parent, kind='stable')
+            bounds = np.searchsorted(self.parent[order], np.arange(-1, len(self.parent) + 1))
+            self._children = (order, bounds)
+        order, bounds = self._children
+        return order[bounds[i + 1]:bounds[i + 2]]
+
+    def edge(self, i):
+        """Attributes of the edge entering the node in position i"""
+        return {'type': self.edge_types[self.edge_type_idx[i]], 'generating_function': self.functions[self.function_idx[i]]}
+
+    def mergiable_id(self, i):
+        if i not in self._mergiable_ids:
+            n = {'value': self.values[self.value_idx[i]], 'type': self.types[self.type_idx[i]], **self.extras.get(i, {})}
+            self._mergiable_ids[i] = _craft_mergiable_id(n)
+        return self._mergiable_ids[i]
+
+    def ancestors(self, i):
+        """Positions of the ancestors of the node in position i, from its father to the root"""
+        l = []
+        p = self.parent[i]
+        while p >= 0:
+            l.append(p)
+            p = self.parent[p]
+        return l
+
+    # networkx-like API
+
+    @property
+    def nodes(self):
+        return _NodesView(self)
+
+    @property
+    def _node(self):
+        return _NodesView(self)
+
+    def __contains__(self, n):
+        return n in self.index
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.parent)
+
+    def __getitem__(self, n):
+        return _AdjacencyView(self, self.index[n])
+
+    def has_node(self, n):
+        return n in self
+
+    def number_of_nodes(self):
+        return len(self)
+
+    def predecessors(self, n):
+        p = self.parent[self.index[n]]
+        return iter([self.ids[p]] if p >= 0 else [])
+
+    def successors(self, n):
+        return iter(self[n])
+
+    def edges(self, data=False):
+        ids = self.ids
+        if data:
+            return [(ids[self.parent[i]], ids[i], self.edge(i)) for i in range(len(self.parent)) if self.parent[i] >= 0]
+        return [(ids[self.parent[i]], ids[i]) for i in range(len(self.parent)) if self.parent[i] >= 0]
+
+
+def _craft_mergiable_id(n):
+    # Imported here, construct_graph imports the features
+    from src.knowledge_graph.construct_graph import craft_id_node_graph
+    return craft_id_node_graph({**n, 'id': None, 'graph': None})
+
+
+class _Table():
+
+    """Distinct values, in order of first appearance, and the position of each"""
+
+    def __init__(self):
+        self.values = []
+        self.positions = {}
+
+    def add(self, v):
+        try:
+            key = (type(v), v)
+            if key not in self.positions:
+                self.positions[key] = len(self.values)
+                self.values.append(v)
+            return self.positions[key]
+        except TypeError:
+            # Unhashable values are not interned
+            self.values.append(v)
+            return len(self.values) - 1
+
+
+def compact_tree(g):
+    """Convert a tree built by construct_graph into a CompactTree.
+
+    Args:
+        g (nx directed graph)
+
+    Returns:
+        CompactTree
+    """
+    nodes = list(g._node)
+    position = {n: i for i, n in enumerate(nodes)}
+
+    parent = np.full(len(nodes), -1, dtype=np.int32)
+    suffix_idx = np.zeros(len(nodes), dtype=np.int32)
+    type_idx = np.zeros(len(nodes), dtype=np.int32)
+    value_idx = np.zeros(len(nodes), dtype=np.int32)
+    edge_type_idx = np.zeros(len(nodes), dtype=np.int32)
+    function_idx = np.zeros(len(nodes), dtype=np.int32)
+    suffixes, types, values, edge_types, functions = _Table(), _Table(), _Table(), _Table(), _Table()
+    edge_types.add(None)
+    functions.add(None)
+    extras = {}
+
+    for i, n in enumerate(nodes):
+        attrs = g._node[n]
+        fathers = list(g._pred[n])
+        assert len(fathers) <= 1, "g is not a tree"
+        if len(fathers) == 1:
+            p = position[fathers[0]]
+            parent[i] = p
+            edge = g._adj[fathers[0]][n]
+            edge_type_idx[i] = edge_types.add(edge['type'])
+            function_idx[i] = functions.add(edge['generating_function'])
+        else:
+            p = -1
+
+        # Ids of nodes are the id of their father plus a suffix. Children of the root are an exception
+        if p > 0:
+            assert n.startswith(nodes[p]), "ids of nodes should extend the id of their father"
+            suffix_idx[i] = suffixes.add(n[len(nodes[p]):])
+        else:
+            suffix_idx[i] = suffixes.add(n)
+
+        type_idx[i] = types.add(attrs['type'])
+        value_idx[i] = values.add(attrs['value'])
+        e = {k: v for k, v in attrs.items() if k not in ['id', 'type', 'value', 'graph', 'mergiable_id']}
+        if len(e) > 0:
+            extras[i] = e
+
+    assert len(nodes) == 0 or nodes[0] == 'source' and parent[0] == -1, "the first node should be source"
+
+    return CompactTree(parent, suffixes.values, suffix_idx, types.values, type_idx, values.values, value_idx,
+                       edge_types.values, edge_type_idx, functions.values, function_idx, extras, dict(g.graph))
+
+
+def to_networkx(t):
+    """Convert a CompactTree back into a networkx tree, as built by construct_graph.
+
+    Args:
+        t (CompactTree)
+
+    Returns:
+        nx directed graph
+    """
+    import networkx as nx
+
+    g = nx.DiGraph(**t.graph)
+    ids = t.ids
+    for i, n in enumerate(ids):
+        g.add_node(n, value=t.values[t.value_idx[i]], type=t.types[t.type_idx[i]], id=n, graph=g, **t.extras.get(i, {}))
+        if i != 0:
+            g._node[n]['mergiable_id'] = t.mergiable_id(i)
+        if t.parent[i] >= 0:
+            g.add_edge(ids[t.parent[i]], n, **t.edge(i))
+    return g
+
+
+def save_trees(trees, path):
+    """Save CompactTrees for load_trees: the per-node arrays of all the trees to path + '.npy', as a single array,
+       and the rest (tables of distinct values, extras, g.graph) pickled to path + '.pkl'.
+
+    Args:
+        trees (list): list of CompactTree
+        path (str): path of the files, without extension
+    """
+    arrays = np.zeros((len(_arrays), sum(len(t) for t in trees)), dtype=np.int32)
+    rest = []
+    offset = 0
+    for t in trees:
+        for k, name in enumerate(_arrays):
+            arrays[k, offset:offset + len(t)] = getattr(t, name)
+        offset += len(t)
+        rest.append((len(t), t.suffixes, t.types, t.values, t.edge_types, t.functions, t.extras, t.graph))
+
+    np.save(f"{path}.npy", arrays)
+    with open(f"{path}.pkl", 'wb') as f:
+        pickle.dump(rest, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_trees(path, mmap_mode='r'):
+    """Load the trees saved by save_trees.
+
+    Args:
+        path (str): path of the files, without extension
+        mmap_mode (str, optional): see np.load. With 'r', the arrays of the trees are read-only views on the file mapped in memory
+
+    Returns:
+        list: list of CompactTree
+    """
+    arrays = np.load(f"{path}.npy", mmap_mode=mmap_mode)
+    with open(f"{path}.pkl", 'rb') as f:
+        rest = pickle.load(f)
+
+    trees = []
+    offset = 0
+    for n, suffixes, types, values, edge_types, functions, extras, graph in rest:
+        parent, suffix_idx, type_idx, value_idx, edge_type_idx, function_idx = arrays[:, offset:offset + n]
+        trees.append(CompactTree(parent, suffixes, suffix_idx, types, type_idx, values, value_idx,
+                                 edge_types, edge_type_idx, functions, function_idx, extras, graph))
+        offset += n
+    return trees
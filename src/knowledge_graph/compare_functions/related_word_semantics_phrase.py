@@ -6,6 +6,7 @@ Created on Tue Mar 31 2020
 
 # from src.data import data
 import wordfreq
+import numpy as np
 import math
 
 # word_embeddings = data.word_embeddings()
@@ -55,3 +56,50 @@ def related_word_semantics_phrase(n1, n2):
                 'word_2': w2}
     else:
         return {'outcome': False}
+
+
+def batch(nodes_1, nodes_2):
+    """Batch form of related_word_semantics_phrase, see resolve_compare_function.batch_compare.
+       Word frequencies are looked up once per word, and the semantical similarities of all the couples of words
+       are computed at once, as the product of the matrices of their normalized embeddings.
+    """
+    global word_embeddings
+
+    word_freqs = {}
+    for n in nodes_1 + nodes_2:
+        if n['value'] not in word_freqs:
+            word_freqs[n['value']] = wordfreq.word_frequency(n['value'], 'en')
+
+    # For both lists: the indices of the nodes whose word is in wordfreq and has an embedding, and their normalized embeddings.
+    # Null embeddings are skipped, their similarity is nan, and related_word_semantics_phrase never relates them
+    known = []
+    for nodes in [nodes_1, nodes_2]:
+        indices = [idx for idx, n in enumerate(nodes) if word_freqs[n['value']] != 0 and n['value'] in word_embeddings]
+        if len(indices) == 0:
+            return []
+        vectors = np.array([word_embeddings[nodes[idx]['value']] for idx in indices])
+        norms = np.linalg.norm(vectors, axis=1)
+        if not np.all(norms > 0):
+            indices = [idx for idx, norm in zip(indices, norms) if norm > 0]
+            vectors, norms = vectors[norms > 0], norms[norms > 0]
+            if len(indices) == 0:
+                return []
+        known.append((indices, vectors / norms[:, None]))
+
+    (indices_1, vectors_1), (indices_2, vectors_2) = known
+    semantical_similarities = vectors_1 @ vectors_2.T
+
+    related = []
+    # Couples below the similarity threshold are skipped, as by related_word_semantics_phrase
+    for a, b in zip(*np.nonzero(semantical_similarities >= 0.4)):
+        w1 = nodes_1[indices_1[a]]['value']
+        w2 = nodes_2[indices_2[b]]['value']
+
+        word_freq_score = (-math.log(word_freqs[w1])-math.log(word_freqs[w2]))/2
+        similarity = word_freq_score*float(semantical_similarities[a, b])
+        if similarity >= 4.0:
+            related.append((indices_1[a], indices_2[b], {'word_1': w1, 'word_2': w2}))
+    return related
+
+
+related_word_semantics_phrase.batch = batch
@@ -17,3 +17,24 @@ def same_word_different_sense_phrase(n1, n2):
                     'word': n1['value']}
 
     return {'outcome': False}
+
+
+def batch(nodes_1, nodes_2):
+    """Batch form of same_word_different_sense_phrase, see resolve_compare_function.batch_compare.
+       Only the couples of phrases with the same value are compared.
+    """
+    # value -> indices of the nodes of nodes_2 with it
+    index = {}
+    for j, n2 in enumerate(nodes_2):
+        index.setdefault(n2['value'], []).append(j)
+
+    related = []
+    for i, n1 in enumerate(nodes_1):
+        for j in index.get(n1['value'], []):
+            result = same_word_different_sense_phrase(n1, nodes_2[j])
+            if result.pop('outcome') == True:
+                related.append((i, j, result))
+    return related
+
+
+same_word_different_sense_phrase.batch = batch
@@ -6,33 +6,61 @@ import re
 thr = 1e-6
 
 
-def uncommon_words(n1, n2):
-    uncommon_words_found = [[], []]
-    for idx, n in enumerate([n1, n2]):
-        words = tokenize(n['value'], funcs_word=[lower])
+def _uncommon_words(n):
+    words = tokenize(n['value'], funcs_word=[lower])
 
-        # Filter out words based on their lengths and if they do not contain any letter
-        filtered_words = []
-        for w in words:
-            if len(w) > 3 and re.search("[a-zA-Z]", w):
-                filtered_words.append(w)
+    # Filter out words based on their lengths and if they do not contain any letter
+    filtered_words = []
+    for w in words:
+        if len(w) > 3 and re.search("[a-zA-Z]", w):
+            filtered_words.append(w)
 
-        words_freqs = {}
-        for w in filtered_words:
-            if w not in words_freqs:
-                probability = wordfreq.word_frequency(
-                    w, 'en', wordlist='large')
-                words_freqs[w] = probability
+    words_freqs = {}
+    for w in filtered_words:
+        if w not in words_freqs:
+            probability = wordfreq.word_frequency(
+                w, 'en', wordlist='large')
+            words_freqs[w] = probability
 
-        res = [key for key in words_freqs.keys()
-               if words_freqs[key] < thr]
-        uncommon_words_found[idx] = res
+    return [key for key in words_freqs.keys()
+            if words_freqs[key] < thr]
 
+
+def _result(uncommon_words_1, uncommon_words_2):
     shared_uncommon_words = set(
-        uncommon_words_found[0]) & set(uncommon_words_found[1])
+        uncommon_words_1) & set(uncommon_words_2)
     if len(shared_uncommon_words) > 0:
         return {'outcome': True,
                 'words': sorted(list(shared_uncommon_words), key=len, reverse=True),
                 }
     else:
         return {'outcome': False}
+
+
+def uncommon_words(n1, n2):
+    return _result(_uncommon_words(n1), _uncommon_words(n2))
+
+
+def batch(nodes_1, nodes_2):
+    """Batch form of uncommon_words, see resolve_compare_function.batch_compare.
+       Every phrase is tokenized once, and only the couples sharing an uncommon word are compared.
+    """
+    uncommon_words_1 = [_uncommon_words(n) for n in nodes_1]
+    uncommon_words_2 = [_uncommon_words(n) for n in nodes_2]
+
+    # uncommon word -> indices of the nodes of nodes_2 containing it
+    index = {}
+    for j, words in enumerate(uncommon_words_2):
+        for w in words:
+            index.setdefault(w, set()).add(j)
+
+    related = []
+    for i, words in enumerate(uncommon_words_1):
+        for j in sorted(set(j for w in words for j in index.get(w, []))):
+            result = _result(words, uncommon_words_2[j])
+            result.pop('outcome')
+            related.append((i, j, result))
+    return related
+
+
+uncommon_words.batch = batch
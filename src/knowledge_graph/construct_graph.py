@@ -2,8 +2,17 @@ import networkx as nx
 import matplotlib.pyplot as plt
 from src.text_processing.preprocess_music_seed_key import preprocess_music_seed_key
 from src.knowledge_graph.applicable_actions import ActionsSupplier
+from src.knowledge_graph.content_hash import tree_hash
+from src.features import registry
+from src.features import stats
+from src.features import decorator_cached_feature
 from src.data import data
+import concurrent.futures
 import json
+import time
+
+# Return value of the remote features that did not finish before the deadline
+_timed_out = object()
 
 
 def initializer(seed):
@@ -37,7 +46,7 @@ def initializer(seed):
     return g
 
 
-def construct_graph(seed, supplier=None, initializer=initializer):
+def construct_graph(seed, supplier=None, initializer=initializer, max_workers=None, deadline=None, max_remote_calls=None):
     """Given a dictionary representing a initial set of nodes, it constructs the directed knowledge graph associated with it.
        It is a tree, a particular kind of graph.
 
@@ -82,9 +91,35 @@ def construct_graph(seed, supplier=None, initializer=initializer):
 
        The type is the attribute used to search for the functions applicable
 
+       The actions supplied in the same round are independent from each other, so they are executed as a wavefront:
+       remote features (MusicBrainz, Wikidata, ..) are dispatched to a pool of threads,
+       and their results are added to the graph in the order of the actions, so that node ids are deterministic.
+
+       The construction can be given a budget: a deadline, measured on a monotonic clock, and/or a maximum number of remote calls.
+       Then, in every round, actions are executed in breadth-first order (nodes closer to source first).
+       When the remote calls run out, only local features are applied; when the deadline passes, the construction stops
+       and returns the tree built so far.
+       Remote calls still running at the deadline are abandoned. g.graph['truncated'] tells whether this happened.
+       Abandoned calls are not interrupted: they finish in the background, and their results still go to the feature cache.
+       Their lifetime is bounded by the request timeouts and retries of the Wikidata and MusicBrainz clients
+       (see src.sparql.query_sparql_wikidata and src.utils.musicbrainz_setup), and the interpreter waits for them at exit.
+
+       Once built, the content hash of the tree is stored in g.graph['hash'], see src.knowledge_graph.content_hash.
+
+       Entailed features (year, month, .. of a date; award_year, .. of an award; word of a token phrase) are fused:
+       whenever nodes are added, their entailed closure is attached in the same step, see ActionsSupplier.fused_actions.
+       The graph is the same, with the same ids and edges, but it takes fewer rounds.
+
+       Within a construction, return values are memoized by feature and content of the arguments (mergiable_id):
+       when the same word, synset, artist, .. appears many times in the tree, e.g. the title of a self-titled album,
+       the subtree of every copy is built from the return values computed for the first one, with no further calls.
+
     Arguments:
         seed {dict} -- 
         supplier {obj} -- Supplies which actions (features) can be applied to the graph nodes
+        max_workers {int} -- Max number of threads calling remote features concurrently. If None, the default of ThreadPoolExecutor
+        deadline {float} -- Seconds after which the construction stops. If None, no deadline
+        max_remote_calls {int} -- Maximum number of remote features applied. If None, no maximum
 
     Returns:
         g {nx directed graph} --
@@ -92,65 +127,282 @@ def construct_graph(seed, supplier=None, initializer=initializer):
     g = initializer(seed)
 
     action_supplier = ActionsSupplier() if supplier is None else supplier
-    action_supplier.set_graph(g)
 
-    while True:
+    _construct([g], [action_supplier], max_workers, deadline, max_remote_calls)
 
-        # Retrieve the applicable functions
-        actions = action_supplier.applicable_actions()
+    return g
 
-        if len(actions) == 0:
-            break
 
-        for action in actions:
+def construct_graphs(seeds, supplier_factory=ActionsSupplier, initializer=initializer, max_workers=None, deadline=None, max_remote_calls=None):
+    """Batch version of construct_graph: constructs the knowledge graphs associated to many seeds at once.
 
-            # Construct the actual dictionary to be passed to the function
+    Graphs are grown together, round by round. In every round, the actions pending for all the graphs are collected,
+    and identical applications of a feature, i.e. the same feature applied to nodes with the same content (mergiable_id),
+    are executed once, in the round or in former ones, and their result is added to every graph that needed it.
+    This is convenient when seeds share artists, albums or words, e.g. songs of a playlist.
 
-            func = action[0]
-            graph_keys = action[1]
-            sig = action[2]
+    The graphs built are the same construct_graph would build for every seed.
 
-            func_args = list(sig.parameters.keys())
+    Args:
+        seeds (list): list of seed dictionaries, see construct_graph
+        supplier_factory (func, optional): called with no arguments, returns a new supplier. One supplier is used for every seed.
+        initializer (func, optional): see construct_graph
+        max_workers (int, optional): see construct_graph
+        deadline (float, optional): see construct_graph. The deadline of every seed starts with the batch
+        max_remote_calls (int, optional): see construct_graph. Every seed has its own maximum, calls shared with other seeds count for each of them
 
-            assert len(graph_keys) == len(func_args)
+    Returns:
+        list: the nx directed graphs, in the same order of seeds
+    """
+    graphs = [initializer(seed) for seed in seeds]
+    suppliers = [supplier_factory() for _ in seeds]
 
-            args = {}
-            for idx in range(len(func_args)):
-                if graph_keys[idx] == "DEFAULTVALUE":
-                    assert sig.parameters[func_args[idx]].default is not inspect.Parameter.empty
-                    args[func_args[idx]] = sig.parameters[func_args[idx]].default
+    _construct(graphs, suppliers, max_workers, deadline, max_remote_calls)
+
+    return graphs
+
+
+def _construct(graphs, suppliers, max_workers, deadline=None, max_remote_calls=None):
+    """Grows graphs by applying the actions provided by their suppliers, until no supplier has actions left,
+       or the budget of the graph runs out
+    """
+    for g, supplier in zip(graphs, suppliers):
+        supplier.set_graph(g)
+
+    budgeted = deadline is not None or max_remote_calls is not None
+    start = time.monotonic()
+    remote_calls = [0] * len(graphs)
+    truncated = [False] * len(graphs)
+
+    # Indices of the graphs that are still growing
+    growing = list(range(len(graphs)))
+
+    # Return values of the calls made so far, see _execute_actions
+    memo = {}
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        _add_entailed_closure(graphs, suppliers, {i: list(g._node) for i, g in enumerate(graphs)}, executor, memo)
+
+        while len(growing) > 0:
+
+            if deadline is not None and time.monotonic() - start >= deadline:
+                for i in growing:
+                    truncated[i] = True
+                break
+
+            # Retrieve the applicable functions
+            actions = []
+            owners = []
+            still_growing = []
+            for i in growing:
+                actions_graph = suppliers[i].applicable_actions()
+                if budgeted:
+                    actions_graph = _budget_actions(suppliers[i], actions_graph, i, remote_calls, truncated, max_remote_calls)
+                if len(actions_graph) > 0:
+                    still_growing.append(i)
+                actions += [(graphs[i], action) for action in actions_graph]
+                owners += [i] * len(actions_graph)
+            growing = still_growing
+
+            timeout = None if deadline is None else max(0, deadline - (time.monotonic() - start))
+            return_values = _execute_actions(actions, executor, timeout, memo)
+
+            # Return values shared among graphs produce nodes with the same content, whose mergiable_id is computed once
+            mergiable_ids = {}
+            added = {}
+            for i, (g, action), return_value in zip(owners, actions, return_values):
+                if return_value is _timed_out:
+                    truncated[i] = True
                 else:
-                    args[func_args[idx]] = g.nodes()[graph_keys[idx]]
+                    added.setdefault(i, []).extend(_add_return_value(g, action, return_value, mergiable_ids))
+
+            _add_entailed_closure(graphs, suppliers, added, executor, memo)
+    finally:
+        # With a deadline, remote calls still running are not waited for
+        executor.shutdown(wait=not budgeted, cancel_futures=True)
 
-            # Call the function
-            return_value = func(**args)
+    for g, t in zip(graphs, truncated):
+        g.graph['truncated'] = t
+        tree_hash(g, recompute=True)
 
-            if return_value is None:
+
+def _budget_actions(supplier, actions, i, remote_calls, truncated, max_remote_calls):
+    """Sort the actions of graph i breadth-first, unless the supplier orders them itself,
+       and drop the remote ones exceeding max_remote_calls.
+       Local features keep being applied after the remote calls run out, they are cheap.
+       Updates remote_calls and truncated.
+    """
+    if not getattr(supplier, 'orders_actions', False):
+        # The depth of a node is the number of features applied to reach it, the number of ~ in its id
+        actions = sorted(actions, key=lambda action: action[1][0].count('~'))
+
+    if max_remote_calls is None:
+        return actions
+
+    kept = []
+    for action in actions:
+        if action[0].__name__ in registry.remote:
+            if remote_calls[i] >= max_remote_calls:
+                truncated[i] = True
                 continue
+            remote_calls[i] += 1
+        kept.append(action)
+    return kept
 
-            return_value = [return_value] if type(return_value) == dict else return_value
-            for idx, v in enumerate(return_value):
 
-                # Resolve node type, edge type and node value
-                edge_type = v.pop('edge_type') if 'edge_type' in v else func.__name__
-                node_type = v.pop('node_type') if 'node_type' in v else func.__annotations__['return']
-                value_node = v.pop('value')
+def _add_entailed_closure(graphs, suppliers, added, executor, memo=None):
+    """Add to the graphs the entailed closure of the nodes just added: the nodes the fused features of the suppliers
+       produce from them, the nodes the fused features produce from those, and so on.
 
-                assert type(edge_type) == str and type(node_type) == str
+    Args:
+        added (dict): index of a graph -> keys of the nodes just added to it
+        memo (dict, optional): see _execute_actions
+    """
+    while len(added) > 0:
+        actions = []
+        owners = []
+        for i, keys in added.items():
+            actions_graph = suppliers[i].fused_actions(keys)
+            actions += [(graphs[i], action) for action in actions_graph]
+            owners += [i] * len(actions_graph)
 
-                # Craft node id
-                id_starting_node = graph_keys[0]
-                id_node = f"{id_starting_node}~{func.__name__}" if idx == 0 else f"{id_starting_node}~{func.__name__}-{idx}"
+        # Fused features are local, so they are all called in the calling thread
+        return_values = _execute_actions(actions, executor, memo=memo)
 
-                generating_function = func.__name__
+        mergiable_ids = {}
+        added = {}
+        for i, (g, action), return_value in zip(owners, actions, return_values):
+            keys = _add_return_value(g, action, return_value, mergiable_ids)
+            if len(keys) > 0:
+                added.setdefault(i, []).extend(keys)
 
-                # Add
-                assert id_node not in g and id_starting_node in g
-                g.add_node(id_node, value=value_node, type=node_type, id=id_node, graph=g, **v)
-                g._node[id_node]['mergiable_id'] = craft_id_node_graph(g._node[id_node])
-                g.add_edge(id_starting_node, id_node, type=edge_type, generating_function=generating_function)
 
-    return g
+def _feature_arguments(g, action):
+    """Construct the actual dictionary to be passed to the function of an action"""
+    func = action[0]
+    graph_keys = action[1]
+
+    func_args = registry.args[func.__name__]
+
+    assert len(graph_keys) == len(func_args)
+
+    args = {}
+    for idx in range(len(func_args)):
+        if graph_keys[idx] == "DEFAULTVALUE":
+            args[func_args[idx]] = registry.defaults[func.__name__][func_args[idx]]
+        else:
+            args[func_args[idx]] = g.nodes()[graph_keys[idx]]
+
+    return args
+
+
+def _execute_actions(actions, executor, timeout=None, memo=None):
+    """Call the functions of a round of actions.
+
+    Actions are couples (g, action), where g is the graph the action is applied to.
+    Calls of the same function with arguments of the same content are executed once.
+    Remote features are submitted to the executor,
+    local ones are called in the calling thread meanwhile.
+
+    Args:
+        timeout (float, optional): seconds to wait for remote features. The ones not finished by then return _timed_out
+        memo (dict, optional): (function, mergiable_ids of the arguments) -> return value.
+                               Calls found in memo are not executed again, the others are added to it once they return.
+
+    Returns:
+        list: The return values of the functions, in the same order of actions
+    """
+    memo = {} if memo is None else memo
+
+    keys = []
+    calls = {}
+    for g, action in actions:
+        key = (action[0], tuple(k if k == "DEFAULTVALUE" else g._node[k]['mergiable_id'] for k in action[1]))
+        if key not in calls and key not in memo:
+            calls[key] = (action[0], _feature_arguments(g, action))
+        keys.append(key)
+
+    futures = {key: executor.submit(_timed_call, func, args) for key, (func, args) in calls.items() if func.__name__ in registry.remote}
+    return_values = {key: _timed_call(func, args) for key, (func, args) in calls.items() if key not in futures}
+    if timeout is not None:
+        concurrent.futures.wait(futures.values(), timeout=timeout)
+    for key, future in futures.items():
+        if timeout is not None and not future.done():
+            future.cancel()
+            return_values[key] = _timed_out
+        else:
+            return_values[key] = future.result()
+
+    for key, return_value in return_values.items():
+        if return_value is not _timed_out:
+            memo[key] = return_value
+
+    return [memo.get(key, _timed_out) for key in keys]
+
+
+def _timed_call(func, args):
+    """Call func, recording its cost in the feature statistics. Values read from the feature cache cost nothing"""
+    decorator_cached_feature.reset_last_call_cached()
+    start = time.perf_counter()
+    r = func(**args)
+    elapsed = time.perf_counter() - start
+    stats.record_call(func.__name__, elapsed, r, remote=func.__name__ in registry.remote,
+                      cached=decorator_cached_feature.last_call_cached())
+    return r
+
+
+def _add_return_value(g, action, return_value, mergiable_ids=None):
+    """Add to g the nodes and edges resulting from the application of the function of an action
+
+    Args:
+        mergiable_ids (dict, optional): (function name, id of a returned dictionary) -> mergiable_id of the node it produced.
+                                        Used to share the mergiable_id among the nodes produced by the same dictionary in many graphs.
+
+    Returns:
+        list: keys of the nodes added
+    """
+    func = action[0]
+    graph_keys = action[1]
+
+    if return_value is None:
+        return []
+
+    # The same return value might be added to many graphs, it is not modified
+    return_value = [return_value] if type(return_value) == dict else return_value
+    stats.record_nodes(func.__name__, len(return_value))
+    added = []
+    for idx, v_returned in enumerate(return_value):
+
+        v = v_returned.copy()
+
+        # Resolve node type, edge type and node value
+        edge_type = v.pop('edge_type') if 'edge_type' in v else func.__name__
+        node_type = v.pop('node_type') if 'node_type' in v else func.__annotations__['return']
+        value_node = v.pop('value')
+
+        assert type(edge_type) == str and type(node_type) == str
+
+        # Craft node id
+        id_starting_node = graph_keys[0]
+        id_node = f"{id_starting_node}~{func.__name__}" if idx == 0 else f"{id_starting_node}~{func.__name__}-{idx}"
+
+        generating_function = func.__name__
+
+        # Add
+        assert id_node not in g and id_starting_node in g
+        g.add_node(id_node, value=value_node, type=node_type, id=id_node, graph=g, **v)
+        if mergiable_ids is None:
+            g._node[id_node]['mergiable_id'] = craft_id_node_graph(g._node[id_node])
+        else:
+            key = (func.__name__, id(v_returned))
+            if key not in mergiable_ids:
+                mergiable_ids[key] = craft_id_node_graph(g._node[id_node])
+            g._node[id_node]['mergiable_id'] = mergiable_ids[key]
+        g.add_edge(id_starting_node, id_node, type=edge_type, generating_function=generating_function)
+        added.append(id_node)
+
+    return added
 
 
 def craft_id_node_graph(n):
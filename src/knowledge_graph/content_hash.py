@@ -0,0 +1,79 @@
+"""
+Deterministic content hashes of trees, nodes and segues.
+
+Python's hash of strings is randomized in every interpreter, so it cannot identify a tree across processes and runs.
+These hashes are blake2b digests of the content, the same in every process, and can be used to key persistent caches
+or to shard work among processes.
+
+The hash of a tree is a Merkle hash: the hash of a node depends on its content, and on the suffixes of the ids,
+the edges and the hashes of its children, regardless of the order in which they were added.
+Trees with the same hash have the same nodes, with the same ids, types, values and edges.
+It is computed by construct_graph and stored in g.graph['hash'].
+"""
+
+import hashlib
+
+# Size of the digests, in bytes
+digest_size = 16
+
+
+def _digest(s):
+    return hashlib.blake2b(s.encode('utf-8'), digest_size=digest_size).hexdigest()
+
+
+def _content(node):
+    # The source node has no mergiable_id
+    content = node.get('mergiable_id')
+    return repr((node['type'], node['value'])) if content is None else content
+
+
+def node_hash(node):
+    """Hash of the content of a node, the same for nodes with the same mergiable_id in any tree.
+
+    Args:
+        node (ngx node)
+
+    Returns:
+        str: hexadecimal digest
+    """
+    return _digest(_content(node))
+
+
+def tree_hash(g, recompute=False):
+    """Hash of the content of a tree.
+
+    Args:
+        g (nx directed graph or CompactTree): tree built by construct_graph
+        recompute (bool, optional): if False, the hash stored in g.graph is returned, if any.
+                                    Otherwise, the hash is computed and stored in g.graph
+
+    Returns:
+        str: hexadecimal digest
+    """
+    if not recompute and 'hash' in g.graph:
+        return g.graph['hash']
+
+    h = {}
+    # Children are added after their father, so they are hashed before it
+    for n in reversed(list(g._node)):
+        children = sorted((c[len(n):] if c.startswith(n) else c, edge['type'], edge['generating_function'], h[c])
+                          for c, edge in g[n].items())
+        h[n] = _digest(repr((_content(g._node[n]), children)))
+
+    g.graph['hash'] = h['source'] if 'source' in h else _digest('')
+    return g.graph['hash']
+
+
+def segue_hash(segue):
+    """Hash of a segue, from the hashes of its trees, the ids of its nodes, its compare function and value.
+
+    Args:
+        segue (dict): as returned by find_segues
+
+    Returns:
+        str: hexadecimal digest
+    """
+    n1 = segue['n1']
+    n2 = segue['n2']
+    return _digest(repr((tree_hash(n1['graph']), n1['id'], tree_hash(n2['graph']), n2['id'],
+                         segue['compare_function'], repr(segue['value']))))
@@ -1,14 +1,26 @@
 import logging
 from tqdm import tqdm
 import numpy as np
-from src.knowledge_graph.construct_graph import construct_graph
+from src.knowledge_graph.kg_store import KGStore
+from src.knowledge_graph.applicable_actions import ActionsSupplier
+from src.features.stats import save_stats
+from src.knowledge_graph.compact_tree import CompactTree, compact_tree, to_networkx
 import os
+import hashlib
+from collections import Counter
 from src.data.data import preprocessed_dataset_path
 
+# Identifies the files written by save_graphs
+_format = 'shared_subtrees'
+
+# Subtrees with less nodes than this are not worth sharing
+min_shared_subtree_size = 2
+
 
 def save_sub_graphs(l, start_from_batch=0, folder_name="sub_graphs_interestingness"):
-    """Build and saves a number of sub-graphs, using the method construct_graph.
-       The construction happens in batch
+    """Build and saves a number of sub-graphs, using the method construct_graphs.
+       The construction happens in batch, so that features applied to the same values in a batch are computed once.
+       Graphs are read from, and saved to, the KG store of full trees, so that other variants can be derived from them
 
     Args:
         l (list): list of dictionaries containing entity keys
@@ -19,41 +31,33 @@ def save_sub_graphs(l, start_from_batch=0, folder_name="sub_graphs_interestingne
     logging.getLogger('root.features').setLevel(logging.ERROR)
 
     batch_size = 100
+    store = KGStore(supplier_factory=ActionsSupplier)
 
-    batch_n = -1
-    sub_graphs = []
-    for idx, d in tqdm(enumerate(l)):
-
-        if idx % batch_size == 0:
-            batch_n += 1
+    for batch_n, idx in enumerate(tqdm(range(0, len(l), batch_size))):
 
         if batch_n >= start_from_batch:
 
-            g = construct_graph(d)
+            sub_graphs = store.prefetch(l[idx:idx+batch_size])
 
-            sub_graphs.append(g)
+            save_graphs(f"{preprocessed_dataset_path}/{folder_name}/{batch_n}", sub_graphs)
 
-            if len(sub_graphs) == batch_size:
-                np.save(f"{preprocessed_dataset_path}/{folder_name}/{batch_n}", sub_graphs)
-                sub_graphs = []
+            save_stats()
 
-    if len(sub_graphs) > 0:
-        np.save(f"{preprocessed_dataset_path}/{folder_name}/{batch_n}", sub_graphs)
 
-
-def load_sub_graphs_generator(folder_name="sub_graphs_interestingness"):
+def load_sub_graphs_generator(folder_name="sub_graphs_interestingness", compact=False):
     """Returns a generator list able to read all the graphs saved in batches by save_sub_graphs in a given folder.
     Every element of the generator is a lambda expression, that, if called, returns the corresponding batch.
 
     Args:
         folder_name (str, optional): Defaults to "sub_graphs_interestingness".
+        compact (bool, optional): If True, graphs are read as CompactTree. Defaults to False.
 
     Returns:
         [list]
     """
 
     def _get_generator(idx, folder_name):
-        return lambda: list(np.load(f"{preprocessed_dataset_path}/{folder_name}/{idx}.npy", allow_pickle=True))
+        return lambda: load_graphs(f"{preprocessed_dataset_path}/{folder_name}/{idx}.npy", compact=compact)
 
     sub_graphs_generator = []
     idx = 0
@@ -78,8 +82,8 @@ def load_sub_graphs(folder_name="sub_graphs_interestingness", n_batches=-1):
     sub_graphs = []
     while True:
         try:
-            batch_sub_graphs = np.load(f"{preprocessed_dataset_path}/{folder_name}/{idx}.npy", allow_pickle=True)
-            sub_graphs += list(batch_sub_graphs)
+            batch_sub_graphs = load_graphs(f"{preprocessed_dataset_path}/{folder_name}/{idx}.npy")
+            sub_graphs += batch_sub_graphs
             idx += 1
 
             if idx == n_batches:
@@ -88,3 +92,175 @@ def load_sub_graphs(folder_name="sub_graphs_interestingness", n_batches=-1):
         except FileNotFoundError:
             break
     return sub_graphs
+
+
+def save_graphs(path, graphs):
+    """Save a list of graphs built by construct_graph in a single file, as packed by pack_graphs.
+       Subtrees shared among the graphs are stored once in the file, which is smaller.
+
+    Args:
+        path (str): as in np.save
+        graphs (list): list of nx directed graphs
+    """
+    # Explicit 0-d array, otherwise numpy would iterate over the content of the dictionary
+    graphs = [to_networkx(g) if type(g) == CompactTree else g for g in graphs]
+    a = np.empty((), dtype=object)
+    a[()] = pack_graphs(graphs)
+    np.save(path, a)
+
+
+def load_graphs(path, compact=False):
+    """Read back a list of graphs saved by save_graphs.
+       Files with a plain array of graphs, as saved by previous versions, are read as well.
+
+    Args:
+        path (str)
+        compact (bool, optional): If True, graphs are returned as CompactTree, which take a fraction of the memory.
+
+    Returns:
+        list: list of nx directed graphs
+    """
+    a = np.load(path, allow_pickle=True)
+    if a.ndim == 0 and type(a.item()) == dict and a.item().get('format') == _format:
+        graphs = unpack_graphs(a.item())
+    else:
+        graphs = list(a)
+    return [compact_tree(g) for g in graphs] if compact else graphs
+
+
+def pack_graphs(graphs):
+    """Compact representation of a list of trees, where identical subtrees are stored once.
+
+    Songs of the same artist (or album, genre, area, ..) share identical subtrees, e.g. the whole
+    artist_name~artist_musicbrainz_id~... subtree. Two subtrees are identical if their nodes have the same
+    content (mergiable_id), the same ids relative to their roots, and the same edges.
+    The subtrees occurring more than once are stored in a table, and every tree refers to them.
+
+    The order of nodes and edges of the trees is kept, so that unpack_graphs returns the same graphs.
+
+    Sharing reduces the size of the files written by save_graphs only: once unpacked, every tree holds its own
+    copy of the shared subtrees (see unpack_graphs), and KGStore stores every tree on its own, without a table of subtrees.
+
+    Args:
+        graphs (list): list of nx directed graphs built by construct_graph
+
+    Returns:
+        dict
+    """
+    hashes = [_subtree_hashes(g) for g in graphs]
+
+    counts = Counter()
+    for h in hashes:
+        counts.update(v for v in h.values() if v is not None)
+
+    subtrees = {}
+    skeletons = []
+    for g, h in zip(graphs, hashes):
+        records = []
+        order = {}
+
+        # Pre-order visit, children in the order they were added
+        stack = [(n, None) for n in reversed([n for n in g._node if g._pred[n] == {}])]
+        while len(stack) > 0:
+            n, p = stack.pop()
+            edge = g._adj[p][n] if p is not None else None
+            hn = h[n]
+            if p is not None and hn is not None and counts[hn] > 1 and hn[1] >= min_shared_subtree_size:
+                if hn not in subtrees:
+                    subtrees[hn] = _subtree_records(g, n)
+                records.append(('s', n, p, edge, hn))
+                for rel_id, _, _, _ in subtrees[hn]:
+                    order[n + rel_id] = len(order)
+            else:
+                records.append(('n', n, p, edge, _node_content(g._node[n])))
+                order[n] = len(order)
+                stack += [(c, n) for c in reversed(list(g._adj[n]))]
+
+        skeletons.append({
+            'graph': g.graph,
+            'records': records,
+            'order': np.array([order[n] for n in g._node], dtype=np.int32),
+        })
+
+    return {'format': _format, 'subtrees': subtrees, 'graphs': skeletons}
+
+
+def unpack_graphs(packed):
+    """Inverse of pack_graphs.
+
+    The attributes of nodes in shared subtrees (values, types, mergiable_id) are shared by reference
+    among the graphs unpacked; ids and the graph back-reference are specific to every graph.
+    So every graph has its own nodes and edges for the shared subtrees, which are not shared in memory.
+    To reduce the memory taken by the trees, load them as CompactTree (load_graphs with compact=True).
+
+    Args:
+        packed (dict)
+
+    Returns:
+        list: list of nx directed graphs
+    """
+    import networkx as nx
+
+    subtrees = packed['subtrees']
+    graphs = []
+    for skeleton in packed['graphs']:
+        g = nx.DiGraph(**skeleton['graph'])
+
+        # Nodes in pre-order, as (id, father id, content, edge attributes)
+        nodes = []
+        for kind, n, p, edge, x in skeleton['records']:
+            if kind == 'n':
+                nodes.append((n, p, x, edge))
+            else:
+                ids = []
+                for rel_id, p_idx, content, e in subtrees[x]:
+                    ids.append(n + rel_id)
+                    nodes.append((ids[-1], p if p_idx < 0 else ids[p_idx], content, edge if p_idx < 0 else e))
+
+        # Restore the original order of insertion
+        for idx in skeleton['order']:
+            n, p, content, edge = nodes[idx]
+            g.add_node(n, **content, id=n, graph=g)
+            if p is not None:
+                g.add_edge(p, n, **edge)
+
+        graphs.append(g)
+
+    return graphs
+
+
+def _node_content(n):
+    return {k: v for k, v in n.items() if k != 'id' and k != 'graph'}
+
+
+def _subtree_records(g, root):
+    """Nodes of the subtree of root in pre-order, as (id relative to root, position of the father, content, edge attributes)"""
+    records = []
+    stack = [(root, None, -1)]
+    while len(stack) > 0:
+        n, p, p_idx = stack.pop()
+        records.append((n[len(root):], p_idx, _node_content(g._node[n]), g._adj[p][n] if p is not None else None))
+        idx = len(records) - 1
+        stack += [(c, n, idx) for c in reversed(list(g._adj[n]))]
+    return records
+
+
+def _subtree_hashes(g):
+    """Node id -> (hash, size) of the subtree rooted in it.
+       The hash is None for subtrees whose ids are not built by appending to the id of the root, which cannot be shared.
+    """
+    h = {}
+    nodes = list(g._node)
+    for n in reversed(nodes):
+        children = list(g._adj[n])
+        if any(h[c] is None or not c.startswith(n) for c in children):
+            h[n] = None
+            continue
+        d = hashlib.blake2b(digest_size=16)
+        d.update(repr(sorted(_node_content(g._node[n]).items())).encode('utf-8'))
+        size = 1
+        for c in children:
+            d.update(repr((c[len(n):], sorted(g._adj[n][c].items()), h[c][0])).encode('utf-8'))
+            size += h[c][1]
+        h[n] = (d.hexdigest(), size)
+    return h
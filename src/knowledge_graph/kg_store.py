@@ -0,0 +1,203 @@
+"""
+Persistent store of song trees, so that the tree of a song is built once, and then read from disk.
+
+Trees are keyed by a canonical hash of their seed, computed after the same preprocessing the initializer applies.
+They are saved in a folder specific to the fingerprint of the construction: the names and the source code of the
+features the supplier can apply, the source code of the modules constructing the trees (construct_graph, the suppliers,
+the feature registry), the supplier and the budget of the construction. Whenever a feature in `src/features/used`
+is added, removed or modified, or the construction changes, the fingerprint changes, and trees are built again
+in a new folder. Old folders can be removed with purge.
+
+Every tree is stored in a file of its own, whole: subtrees shared among trees are stored once only in the batch
+files of save_graphs, see src.knowledge_graph.io.pack_graphs.
+
+A store of full trees (built with ActionsSupplier) serves the trees of any supplier variant through project,
+which derives them from the full trees, see src.knowledge_graph.projection.
+"""
+
+from src.knowledge_graph.construct_graph import construct_graph, construct_graphs
+from src.knowledge_graph.applicable_actions import InformativeActionSupplier
+from src.knowledge_graph.projection import project_trees
+from src.text_processing.preprocess_music_seed_key import preprocess_music_seed_key
+from src.features import registry
+from src.data.data import preprocessed_dataset_path
+import numpy as np
+import hashlib
+import shutil
+import importlib
+import json
+import os
+
+# Modules constructing the trees, besides the features
+_construction_modules = ['src.knowledge_graph.construct_graph', 'src.knowledge_graph.applicable_actions', 'src.features.registry']
+
+
+def seed_key(seed):
+    """Canonical hash of a seed: seeds differing only in what preprocess_music_seed_key removes share the key.
+
+    Args:
+        seed (dict): see construct_graph
+
+    Returns:
+        str
+    """
+    d = dict(seed)
+    if 'track_name' in d:
+        d['track_name'] = preprocess_music_seed_key(d['track_name'])
+    if 'album_name' in d:
+        d['album_name'] = preprocess_music_seed_key(d['album_name'])
+    return hashlib.sha1(json.dumps(d, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _source_digest(module):
+    with open(importlib.import_module(module).__file__, 'rb') as f:
+        return hashlib.sha1(f.read()).digest()
+
+
+def feature_set_fingerprint(supplier_factory=InformativeActionSupplier, deadline=None, max_remote_calls=None):
+    """Hash of the features the suppliers built by supplier_factory can apply, of their source code,
+       of the source code of the modules constructing the trees, and of the budget of the construction.
+
+    Args:
+        supplier_factory (func, optional)
+        deadline (float, optional): see construct_graph
+        max_remote_calls (int, optional): see construct_graph
+
+    Returns:
+        str
+    """
+    h = hashlib.sha1(json.dumps([f"{supplier_factory.__module__}.{supplier_factory.__qualname__}", deadline, max_remote_calls]).encode('utf-8'))
+    for module in sorted(set(_construction_modules) | {supplier_factory.__module__}):
+        h.update(_source_digest(module))
+    for name in sorted(supplier_factory().eligible_actions()):
+        h.update(name.encode('utf-8'))
+        h.update(_source_digest(registry.functions[name].__module__))
+    return h.hexdigest()
+
+
+class KGStore():
+
+    """Get-or-build access to the trees of seeds.
+
+    Example:
+        store = KGStore()
+        trees = store.prefetch(playlist_seeds)
+        tree = store.get_or_build(seed)
+
+        full_store = KGStore(supplier_factory=ActionsSupplier)
+        informative_trees = full_store.project(playlist_seeds, InformativeActionSupplier)
+    """
+
+    def __init__(self, folder_name="kg_store", supplier_factory=InformativeActionSupplier, max_workers=None, deadline=None, max_remote_calls=None):
+        """
+        Args:
+            folder_name (str, optional): Folder in the preprocessed dataset path where trees are saved.
+            supplier_factory (func, optional): Supplier used to build trees, see construct_graphs
+            max_workers (int, optional): see construct_graph
+            deadline (float, optional): see construct_graph
+            max_remote_calls (int, optional): see construct_graph
+        """
+        self.folder = f"{preprocessed_dataset_path}/{folder_name}"
+        self.supplier_factory = supplier_factory
+        self.max_workers = max_workers
+        self.deadline = deadline
+        self.max_remote_calls = max_remote_calls
+        self.refresh()
+
+    def refresh(self):
+        """Re-compute the fingerprint of the construction. To be called if features change while the store is in use."""
+        self.fingerprint = feature_set_fingerprint(self.supplier_factory, self.deadline, self.max_remote_calls)
+        self.path = f"{self.folder}/{self.fingerprint}"
+
+    def _tree_path(self, key):
+        return f"{self.path}/{key[:2]}/{key}.npy"
+
+    def __contains__(self, seed):
+        return os.path.exists(self._tree_path(seed_key(seed)))
+
+    def get(self, seed):
+        """Returns the stored tree of seed, None if it is not stored."""
+        try:
+            return np.load(self._tree_path(seed_key(seed)), allow_pickle=True).item()
+        except FileNotFoundError:
+            return None
+
+    def put(self, seed, g):
+        """Stores the tree g of seed. The file is written atomically, so that concurrent readers never see it partially."""
+        path = self._tree_path(seed_key(seed))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        # Explicit 0-d array, otherwise numpy would iterate over the nodes of g
+        a = np.empty((), dtype=object)
+        a[()] = g
+        with open(tmp_path, 'wb') as f:
+            np.save(f, a)
+        os.replace(tmp_path, path)
+
+    def get_or_build(self, seed):
+        """Returns the stored tree of seed, building and storing it if it is not stored."""
+        g = self.get(seed)
+        if g is None:
+            g = construct_graph(dict(seed), supplier=self.supplier_factory(), max_workers=self.max_workers,
+                                deadline=self.deadline, max_remote_calls=self.max_remote_calls)
+            self.put(seed, g)
+        return g
+
+    def prefetch(self, seeds):
+        """Batch version of get_or_build, e.g. for the songs of a playlist.
+           The trees missing are built together with construct_graphs, and seeds with the same key are built once.
+
+        Args:
+            seeds (list): list of seed dictionaries
+
+        Returns:
+            list: the trees, in the same order of seeds
+        """
+        trees = [self.get(seed) for seed in seeds]
+
+        missing = {}
+        for seed, g in zip(seeds, trees):
+            if g is None:
+                missing.setdefault(seed_key(seed), seed)
+
+        if len(missing) > 0:
+            built = construct_graphs([dict(seed) for seed in missing.values()], supplier_factory=self.supplier_factory,
+                                     max_workers=self.max_workers, deadline=self.deadline, max_remote_calls=self.max_remote_calls)
+            built = dict(zip(missing.keys(), built))
+            for key, seed in missing.items():
+                self.put(seed, built[key])
+            trees = [built[seed_key(seed)] if g is None else g for seed, g in zip(seeds, trees)]
+
+        return trees
+
+    def project(self, seeds, supplier_factory):
+        """As prefetch, but returns the trees the suppliers of supplier_factory would build,
+           derived from the stored ones by removing the nodes of the features they cannot apply.
+           Raises ValueError if they cannot be derived exactly, see src.knowledge_graph.projection.
+
+        Args:
+            seeds (list): list of seed dictionaries
+            supplier_factory (func): called with no arguments, returns a new supplier
+
+        Returns:
+            list: the trees, in the same order of seeds
+        """
+        return project_trees(self.prefetch(seeds), supplier_factory, self.supplier_factory)
+
+    def invalidate(self, seeds=None):
+        """Remove the stored trees of seeds, or all the trees stored with the current feature set if seeds is None."""
+        if seeds is None:
+            shutil.rmtree(self.path, ignore_errors=True)
+        else:
+            for seed in seeds:
+                try:
+                    os.remove(self._tree_path(seed_key(seed)))
+                except FileNotFoundError:
+                    pass
+
+    def purge(self):
+        """Remove the trees stored with feature sets, or constructions, different from the current one."""
+        if os.path.exists(self.folder):
+            for fingerprint in os.listdir(self.folder):
+                if fingerprint != self.fingerprint:
+                    shutil.rmtree(f"{self.folder}/{fingerprint}", ignore_errors=True)
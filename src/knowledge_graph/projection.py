@@ -0,0 +1,132 @@
+"""
+Projection of song trees on a subset of the features.
+
+The tree a supplier builds from a seed, when the supplier can apply only a subset of the features of another one,
+is the tree the other supplier builds minus the subtrees rooted at nodes generated by the excluded features:
+nodes are added by the same features, with the same ids, whatever else is in the tree.
+So the tree of any variant (e.g. InformativeActionSupplier) can be derived from a stored full tree,
+without calling the features again.
+
+This holds as long as the features kept do not take, as second or further argument, a node that might lie in an
+excluded subtree: then, in the full tree, they could produce a node from arguments the variant never has.
+project_tree checks it from the types of the features, and raises ValueError if the projection could be inexact.
+"""
+
+from src.features import used
+from src.features import registry
+from src.knowledge_graph.applicable_actions import ActionsSupplier
+from src.knowledge_graph.compact_tree import CompactTree, compact_tree, to_networkx
+from src.knowledge_graph.content_hash import tree_hash
+import networkx as nx
+
+# Caches stored in g.graph and computed from the nodes of the tree, see segues_filtering.pre_verdicts
+# and interestingness_GB.path_aggregates. Projections recompute them, instead of sharing the ones of the full tree
+_tree_caches = set(['pre_verdicts', 'path_aggregates'])
+
+
+def excluded_types(features, full_features=used.__all__):
+    """Node types that can appear in the subtrees rooted at the nodes generated by the excluded features.
+
+    Args:
+        features (list): names of the features kept
+        full_features (list, optional): names of the features the full trees were built with
+
+    Returns:
+        set
+    """
+    excluded = set(full_features) - set(features)
+    types = set(t for name in excluded for l in registry.out_types[name].values() for t in l)
+
+    changed = True
+    while changed:
+        changed = False
+        for name in full_features:
+            if any(t in types for arg_types in registry.args_types[name] for t in arg_types):
+                new_types = set(t for l in registry.out_types[name].values() for t in l) - types
+                if len(new_types) > 0:
+                    types |= new_types
+                    changed = True
+
+    return types
+
+
+def check_projectable(features, full_features=used.__all__):
+    """Raises ValueError if the trees built with features cannot be derived exactly from the trees built with full_features.
+
+    Args:
+        features (list): names of the features kept
+        full_features (list, optional): names of the features the full trees were built with
+    """
+    if not set(features) <= set(full_features):
+        raise ValueError(f"features not in the full trees: {sorted(set(features) - set(full_features))}")
+
+    types = excluded_types(features, full_features)
+    for name in features:
+        # Nodes fed as first argument are the fathers of the nodes produced, so they are removed together
+        for arg_types in registry.args_types[name][1:]:
+            if any(t in types for t in arg_types):
+                raise ValueError(f"{name} can take arguments from the subtrees of the excluded features, "
+                                 "the projection would not be exact")
+        if len(registry.defaults[name]) > 0 and len(set(full_features) - set(features)) > 0:
+            raise ValueError(f"{name} has default values, which are used depending on the other features applicable")
+
+
+def project_tree(g, features, full_features=used.__all__, check=True):
+    """Derive from g, built with full_features, the tree built with features only.
+       The nodes generated by the excluded features are removed, together with their subtrees. Ids are preserved.
+
+    Args:
+        g (nx directed graph or CompactTree): tree built by construct_graph
+        features (list): names of the features kept
+        full_features (list, optional): names of the features g was built with
+        check (bool, optional): whether to call check_projectable
+
+    Returns:
+        nx directed graph or CompactTree, as g
+    """
+    if check:
+        check_projectable(features, full_features)
+
+    if isinstance(g, CompactTree):
+        return compact_tree(project_tree(to_networkx(g), features, full_features, check=False))
+
+    features = set(features)
+
+    # Nodes are visited in insertion order, so fathers come before their children
+    kept = set()
+    for n in g._node:
+        fathers = list(g._pred[n])
+        if len(fathers) == 0:
+            kept.add(n)
+        elif fathers[0] in kept:
+            function = g._adj[fathers[0]][n]['generating_function']
+            if function == 'init' or function in features:
+                kept.add(n)
+
+    p = nx.DiGraph(**{k: v for k, v in g.graph.items() if k not in _tree_caches})
+    for n, attrs in g._node.items():
+        if n in kept:
+            p.add_node(n, **{**attrs, 'graph': p})
+    for u, v, attrs in g.edges(data=True):
+        if v in kept:
+            p.add_edge(u, v, **attrs)
+    tree_hash(p, recompute=True)
+    return p
+
+
+def project_trees(graphs, supplier_factory, full_supplier_factory=ActionsSupplier):
+    """Derive the trees built with the suppliers of supplier_factory from the trees built with the ones of full_supplier_factory.
+
+    Args:
+        graphs (list): trees built by construct_graph
+        supplier_factory (func): called with no arguments, returns a new supplier
+        full_supplier_factory (func, optional): as supplier_factory, the suppliers graphs were built with
+
+    Returns:
+        list
+    """
+    features = supplier_factory().eligible_actions()
+    full_features = full_supplier_factory().eligible_actions()
+    check_projectable(features, full_features)
+
+    return [project_tree(g, features, full_features, check=False) for g in graphs]
@@ -1,5 +1,6 @@
 from src.knowledge_graph.compare_functions import *
 from src.utils.utils_ngx_graph import father
+import itertools
 import copy
 """
 _dict says with which function compare couple of nodes, based on their type.
@@ -53,3 +54,32 @@ def resolve_compare_function(n1, n2, d=_dict):
 
     else:
         return []
+
+
+def batch_compare(compare_function, nodes_1, nodes_2):
+    """Apply a compare function to all the couples of nodes from nodes_1 and nodes_2.
+
+    A compare function can have a batch form, in its attribute batch: a function taking the two lists of nodes,
+    and returning the couples related, as this function does. It can then share work among the couples,
+    e.g. computing once what depends on a single node, and skip the couples that cannot be related.
+    Otherwise, the compare function is applied to every couple.
+
+    Args:
+        compare_function (function)
+        nodes_1 (list): first nodes of the couples
+        nodes_2 (list): second nodes of the couples
+
+    Returns:
+        list: (index in nodes_1, index in nodes_2, result of the compare function without outcome) for every couple related,
+              in the order of itertools.product
+    """
+    batch = getattr(compare_function, 'batch', None)
+    if batch is not None:
+        return sorted(batch(nodes_1, nodes_2), key=lambda related: related[:2])
+
+    related = []
+    for (idx_1, n1), (idx_2, n2) in itertools.product(enumerate(nodes_1), enumerate(nodes_2)):
+        result = compare_function(n1, n2)
+        if result.pop('outcome') == True:
+            related.append((idx_1, idx_2, result))
+    return related
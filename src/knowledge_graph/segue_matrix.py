@@ -0,0 +1,183 @@
+"""
+Process-parallel computation of the segues between all the couples of songs of a playlist.
+
+A SegueMatrixBuilder keeps a pool of worker processes, which load the project (features, filters, compare functions)
+once, and are reused across playlists. For every playlist, the trees are saved once as CompactTree (see save_trees):
+the per-node arrays of all the trees go to a single file, that every worker maps in memory, so that the arrays are
+shared by the workers instead of being copied into each; only the small tables of distinct values are unpickled.
+Workers merge the trees and index them as all_segues does, then compute the segues of the rows of the matrix
+assigned to them, and send them back as compact records: tuples with the ids of the two nodes
+and the other fields of the segue, which are turned back into segues on the trees of the calling process.
+
+Workers are started with forkserver (spawn where it is not available), not fork: the calling process can have
+threads alive, e.g. the ones of construct_graph, and a fork copies the locks they hold, deadlocking the workers.
+So the parameters of find_segues are pickled, by reference, and scripts using the builder need an
+`if __name__ == "__main__":` guard.
+
+The segues of a couple are computed by a single worker, in the same way as find_segues, so the result
+does not depend on the number of workers.
+"""
+
+from src.knowledge_graph.walk_graph import _MergedRootPaths, _candidates, _join, _all_segues, get_segue_store
+from src.knowledge_graph.segue_store import segue_record, segue_from_record, segues_from_records
+from src.knowledge_graph.segues_filtering import pre, post, nodes_types_to_filter_strict
+from src.knowledge_graph.compact_segues import CompactSegues
+from src.knowledge_graph.compact_tree import CompactTree, compact_tree, save_trees, load_trees
+from src.knowledge_graph.resolve_compare_function import get_dict
+from src.utils.timing import timed_phase
+import multiprocessing
+import concurrent.futures
+import itertools
+import tempfile
+import shutil
+import os
+
+# State of a worker process: parameters of find_segues, and the playlist it is working on
+_worker = {}
+
+
+def _init_worker(kwargs):
+    _worker['kwargs'] = kwargs
+    _worker['key'] = None
+
+
+def _load_playlist(key, path):
+    if _worker['key'] != key:
+        I = load_trees(path)
+        tries = [_MergedRootPaths(g, _worker['kwargs']['nodes_types_to_filter']) for g in I]
+        _worker.update(key=key, I=I, tries=tries, candidates=_candidates(tries), pre_cache={})
+
+
+def _rows(key, path, rows):
+    """Records of the segues of the rows of the matrix, computed in a worker.
+       rows is a list of (i, list of j), the couples (i, j) to compute
+    """
+    _load_playlist(key, path)
+    I, tries, candidates, kwargs = _worker['I'], _worker['tries'], _worker['candidates'], _worker['kwargs']
+
+    records = {}
+    for i, columns in rows:
+        for j in columns:
+            segues = _join(I[i], tries[i], I[j], tries[j], sorted(candidates.get((i, j), [])), kwargs['pre_filtering'],
+                           kwargs['post_filtering'], kwargs['nodes_types_to_segue_not_equal'], _worker['pre_cache'])
+            records[(i, j)] = [segue_record(segue) for segue in segues]
+    return records
+
+
+class SegueMatrixBuilder():
+
+    """Computes the segues between all the couples of songs of playlists, with a pool of processes.
+
+    Example:
+        with SegueMatrixBuilder() as builder:
+            for I in playlists:
+                segues = builder.segues(I)
+                ...
+    """
+
+    def __init__(self, max_workers=None, pre_filtering=pre, post_filtering=post, nodes_types_to_filter=nodes_types_to_filter_strict,
+                 nodes_types_to_segue_not_equal=get_dict()):
+        """
+        Args:
+            max_workers (int, optional): Number of processes. If None, the number of CPUs. With 1, segues are computed in the calling process
+            Others: see find_segues
+        """
+        self.max_workers = os.cpu_count() if max_workers is None else max_workers
+        self.kwargs = {'pre_filtering': pre_filtering, 'post_filtering': post_filtering,
+                       'nodes_types_to_filter': nodes_types_to_filter, 'nodes_types_to_segue_not_equal': nodes_types_to_segue_not_equal}
+        self._executor = None
+        # Number of playlists sent to the pool so far, identifies the playlist workers are working on
+        self._n_playlists = 0
+
+    def _pool(self):
+        if self._executor is None:
+            # Not fork, see the module docstring. The forkserver loads this module once, and workers are forked from it
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload([__name__])
+            else:
+                context = multiprocessing.get_context('spawn')
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context,
+                                                                    initializer=_init_worker, initargs=(self.kwargs,))
+        return self._executor
+
+    @timed_phase('segues')
+    def records(self, I):
+        """Records of the segues between all the ordered couples of trees in I.
+
+        Args:
+            I (list): list of trees
+
+        Returns:
+            dict: (i, j) -> list of records, see segue_record, for every i != j
+        """
+        store = get_segue_store()
+        if store is not None:
+            return store.records(I, lambda couples: self._records(I, couples), **self.kwargs)
+        return self._records(I, list(itertools.permutations(range(len(I)), 2)))
+
+    def _records(self, I, couples):
+        """Records of the segues of the couples (i, j) given"""
+        if self.max_workers == 1 or len(I) < 3:
+            return {k: [segue_record(segue) for segue in l] for k, l in _all_segues(I, couples, **self.kwargs).items()}
+
+        # The couples to compute, by row
+        rows = {}
+        for i, j in couples:
+            rows.setdefault(i, []).append(j)
+        rows = sorted(rows.items())
+
+        folder = tempfile.mkdtemp()
+        path = f"{folder}/trees"
+        try:
+            save_trees([g if isinstance(g, CompactTree) else compact_tree(g) for g in I], path)
+
+            # Rows are interleaved, so that tasks are balanced
+            n_tasks = min(len(rows), self.max_workers * 4)
+            self._n_playlists += 1
+            futures = [self._pool().submit(_rows, self._n_playlists, path, rows[k::n_tasks]) for k in range(n_tasks)]
+            records = {}
+            for future in futures:
+                records.update(future.result())
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+        return {couple: records[couple] for couple in couples}
+
+    def segues(self, I):
+        """Segues between all the ordered couples of trees in I, as returned by all_segues"""
+        return segues_from_records(I, self.records(I))
+
+    def compact_segues(self, I):
+        """Segues between all the ordered couples of trees in I, stored compactly, see CompactSegues"""
+        segues = CompactSegues(I)
+        for couple, records in self.records(I).items():
+            segues.add_records(couple, records)
+        return segues
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+
+def segue_matrix(I, max_workers=None, **kwargs):
+    """Segues between all the ordered couples of trees in I, as returned by all_segues, computed with a pool of processes.
+       To compute the segues of many playlists, use a SegueMatrixBuilder, so that the pool is created once.
+
+    Args:
+        I (list): list of trees
+        max_workers (int, optional): see SegueMatrixBuilder
+        kwargs: see find_segues
+
+    Returns:
+        dict: (i, j) -> list of segues
+    """
+    with SegueMatrixBuilder(max_workers, **kwargs) as builder:
+        return builder.segues(I)
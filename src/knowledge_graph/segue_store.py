@@ -0,0 +1,178 @@
+"""
+Persistent store of the segues between trees, so that the segues of a couple of songs are found once, and then read from disk.
+
+Segues are keyed by the content hashes of the two trees (see content_hash), and saved in a folder specific to the
+fingerprint of the configuration of find_segues: the filters, the node types filtered out, the compare functions,
+the source code of the modules defining them and of walk_graph, and the data the filters depend on (data_files).
+Whenever any of them changes, segues are found again in a new folder. Old folders can be removed with purge.
+
+Segues are stored as records (see segue_record), with the ids of their nodes, which are the same in trees with the same hash.
+For every tree, a file holds the records of the segues from it to every tree it was joined with.
+
+Once a store is set with walk_graph.set_segue_store, find_segues, all_segues and SegueMatrixBuilder read and write it.
+"""
+
+from src.knowledge_graph.content_hash import tree_hash
+from src.knowledge_graph.segues_filtering import pre, post, nodes_types_to_filter_strict
+from src.knowledge_graph.resolve_compare_function import get_dict
+from src.data.data import preprocessed_dataset_path
+from src.data.word_concreteness import concreteness_path
+from collections import defaultdict
+import numpy as np
+import itertools
+import hashlib
+import shutil
+import fcntl
+import json
+import importlib
+import os
+
+# Files of data the filters depend on, e.g. the concreteness scores of pre
+data_files = [concreteness_path]
+
+# Fingerprints of the configurations seen so far, by description
+_fingerprints = {}
+
+
+def segue_record(segue):
+    """Compact, picklable form of a segue: (id of n1, id of n2, dictionary of the other fields)"""
+    return (segue['n1']['id'], segue['n2']['id'], {k: v for k, v in segue.items() if k != 'n1' and k != 'n2'})
+
+
+def segue_from_record(g1, g2, record):
+    """Segue from g1 to g2 of a record made by segue_record"""
+    id_1, id_2, fields = record
+    return {'n1': g1._node[id_1], 'n2': g2._node[id_2], **fields}
+
+
+def segues_from_records(I, records):
+    """Turn records, e.g. the ones returned by SegueMatrixBuilder.records, into segues.
+
+    Args:
+        I (list): list of trees
+        records (dict): (i, j) -> list of records
+
+    Returns:
+        dict: (i, j) -> list of segues, as returned by all_segues
+    """
+    return {(i, j): [segue_from_record(I[i], I[j], r) for r in l] for (i, j), l in records.items()}
+
+
+def _name(f):
+    return None if f is None else f"{f.__module__}.{f.__qualname__}"
+
+
+def segues_fingerprint(pre_filtering=pre, post_filtering=post, nodes_types_to_filter=nodes_types_to_filter_strict,
+                       nodes_types_to_segue_not_equal=get_dict()):
+    """Hash of the configuration of find_segues, of the source code of the modules defining how segues are found,
+       and of the content of data_files.
+
+    Args:
+        see find_segues
+
+    Returns:
+        str
+    """
+    description = json.dumps([_name(pre_filtering), _name(post_filtering), sorted(nodes_types_to_filter),
+                              sorted([list(types), [_name(f) for f in functions]] for types, functions in nodes_types_to_segue_not_equal.items())])
+    if description not in _fingerprints:
+        functions = [pre_filtering, post_filtering] + [f for functions in nodes_types_to_segue_not_equal.values() for f in functions]
+        modules = set(f.__module__ for f in functions if f is not None) | {'src.knowledge_graph.walk_graph'}
+
+        h = hashlib.sha1(description.encode('utf-8'))
+        for module in sorted(modules):
+            with open(importlib.import_module(module).__file__, 'rb') as f:
+                h.update(hashlib.sha1(f.read()).digest())
+        for path in data_files:
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    h.update(hashlib.sha1(f.read()).digest())
+            else:
+                h.update(b'missing')
+        _fingerprints[description] = h.hexdigest()
+    return _fingerprints[description]
+
+
+class SegueStore():
+
+    """Get-or-compute access to the segues between trees.
+
+    Example:
+        set_segue_store(SegueStore())
+        segues = all_segues(I)  # found, or read from disk
+    """
+
+    def __init__(self, folder_name="segue_store"):
+        """
+        Args:
+            folder_name (str, optional): Folder in the preprocessed dataset path where segues are saved.
+        """
+        self.folder = f"{preprocessed_dataset_path}/{folder_name}"
+
+    def _path(self, fingerprint, h):
+        return f"{self.folder}/{fingerprint}/{h[:2]}/{h}.npy"
+
+    def _load(self, fingerprint, h):
+        try:
+            return np.load(self._path(fingerprint, h), allow_pickle=True).item()
+        except FileNotFoundError:
+            return {}
+
+    def _save(self, fingerprint, h, records):
+        """Add records, tree hash -> list of records, to the file of the tree with hash h.
+           Writers hold a lock on a file next to it while they read it again, update and write it,
+           so that processes in parallel do not lose each other segues.
+           The file is written atomically, so that readers, which take no lock, never see it partially.
+        """
+        path = self._path(fingerprint, h)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.lock", 'wb') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            stored = self._load(fingerprint, h)
+            stored.update(records)
+
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.save(f, stored)
+            os.replace(tmp_path, path)
+
+    def records(self, I, compute, couples=None, **kwargs):
+        """Records of the segues between couples of trees in I, read from disk, or computed and stored.
+
+        Args:
+            I (list): list of trees
+            compute (func): called with a list of couples (i, j), returns the records of their segues, (i, j) -> list of records
+            couples (list, optional): couples (i, j) to return. If None, all the ordered couples i != j
+            kwargs: configuration of find_segues the records are computed with, see segues_fingerprint
+
+        Returns:
+            dict: (i, j) -> list of records, in the order of couples
+        """
+        couples = list(itertools.permutations(range(len(I)), 2)) if couples is None else couples
+        fingerprint = segues_fingerprint(**kwargs)
+        hashes = [tree_hash(g) for g in I]
+        stored = {h: self._load(fingerprint, h) for h in set(hashes[i] for i, _ in couples)}
+
+        missing = [(i, j) for i, j in couples if hashes[j] not in stored[hashes[i]]]
+        if len(missing) > 0:
+            computed = compute(missing)
+            new = defaultdict(dict)
+            for i, j in missing:
+                stored[hashes[i]][hashes[j]] = computed[(i, j)]
+                new[hashes[i]][hashes[j]] = computed[(i, j)]
+            for h, records in new.items():
+                self._save(fingerprint, h, records)
+
+        return {(i, j): stored[hashes[i]][hashes[j]] for i, j in couples}
+
+    def invalidate(self, **kwargs):
+        """Remove the segues stored with the configuration of find_segues in kwargs, see segues_fingerprint."""
+        shutil.rmtree(f"{self.folder}/{segues_fingerprint(**kwargs)}", ignore_errors=True)
+
+    def purge(self, **kwargs):
+        """Remove the segues stored with configurations of find_segues different from the one in kwargs, see segues_fingerprint."""
+        fingerprint = segues_fingerprint(**kwargs)
+        if os.path.exists(self.folder):
+            for f in os.listdir(self.folder):
+                if f != fingerprint:
+                    shutil.rmtree(f"{self.folder}/{f}", ignore_errors=True)
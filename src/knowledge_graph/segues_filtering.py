@@ -1,6 +1,9 @@
 from src.utils.utils_ngx_graph import father, artist_name
-from src.data.word_concreteness import word_concreteness
+from src.data.word_concreteness import word_concreteness, concreteness_path
 from src.text_processing.preprocess_word import stem
+import hashlib
+import importlib
+import os
 
 
 def _node_originating_synset(n):
@@ -107,6 +110,73 @@ def pre(n, func):
     return True
 
 
+# Modules, other than this one, whose source the verdicts of the pre-filters depend on, see verdicts_fingerprint
+_filter_modules = ['src.utils.utils_ngx_graph', 'src.data.word_concreteness', 'src.text_processing.preprocess_word']
+
+_verdicts_fingerprint = None
+
+
+def verdicts_fingerprint():
+    """Hash of the source code of the pre-filters, and of the concreteness data they read.
+       Identifies the verdicts stored in the trees by pre_verdicts.
+
+    Returns:
+        str
+    """
+    global _verdicts_fingerprint
+    if _verdicts_fingerprint is None:
+        h = hashlib.sha1()
+        for path in [__file__] + [importlib.import_module(module).__file__ for module in _filter_modules]:
+            with open(path, 'rb') as f:
+                h.update(hashlib.sha1(f.read()).digest())
+        if os.path.exists(concreteness_path):
+            with open(concreteness_path, 'rb') as f:
+                h.update(hashlib.sha1(f.read()).digest())
+        else:
+            h.update(b'missing')
+        _verdicts_fingerprint = h.hexdigest()
+    return _verdicts_fingerprint
+
+
+def pre_verdicts(g, func):
+    """Verdicts of pre on the nodes of g whose type has a pre-filter for the compare function func.
+       They depend only on the node and its ancestors, so they are computed once per tree, and stored in g.graph['pre_verdicts'],
+       together with the fingerprint of the filters and of the data they depend on: they are computed again only if these change.
+
+    Args:
+        g (ngx graph)
+        func (function): Compare function's name
+
+    Returns:
+        dict: node id -> bool. Nodes whose pre-filter raises an exception are left out
+    """
+    fingerprint = verdicts_fingerprint()
+    stored = g.graph.get('pre_verdicts')
+    # Trees saved before verdicts were fingerprinted store them in a dict
+    if not isinstance(stored, tuple) or stored[0] != fingerprint:
+        g.graph['pre_verdicts'] = (fingerprint, {})
+    verdicts = g.graph['pre_verdicts'][1]
+    if func not in verdicts:
+        d = {}
+        for k in g._node:
+            n = g._node[k]
+            if n['type'] in _pre and func in _pre[n['type']]:
+                try:
+                    d[k] = bool(_pre[n['type']][func](n))
+                except Exception:
+                    pass
+        verdicts[func] = d
+    return verdicts[func]
+
+
+def pre_stored(n, func):
+    """Same as pre, but reads the verdict stored in the tree of n by pre_verdicts"""
+    if n['type'] in _pre and func in _pre[n['type']]:
+        verdict = pre_verdicts(n['graph'], func).get(n['id'])
+        return _pre[n['type']][func](n) if verdict is None else verdict
+    return True
+
+
 def post(n1, n2, func):
     """Post-filter segues, so nodes that satisfy a compare functions.
 
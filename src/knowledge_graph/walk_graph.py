@@ -1,8 +1,9 @@
-from networkx.algorithms.simple_paths import _all_simple_paths_graph
 import itertools
-from src.knowledge_graph.segues_filtering import pre, post, nodes_types_to_filter_strict
+from src.knowledge_graph.segues_filtering import pre, post, nodes_types_to_filter_strict, pre_stored
 from collections import defaultdict
-from src.knowledge_graph.resolve_compare_function import get_dict
+from src.knowledge_graph.resolve_compare_function import get_dict, batch_compare
+from src.knowledge_graph.segue_store import segue_record, segue_from_record, segues_from_records
+from src.utils.timing import timed_phase
 
 
 def check_filters(segue, pre_filtering, post_filtering):
@@ -15,6 +16,29 @@ def check_filters(segue, pre_filtering, post_filtering):
     return True
 
 
+# Maximum number of nodes in the path of a segue, sources included
+max_path_length = 51
+
+# Store of segues, read and written by find_segues and all_segues, see set_segue_store
+_store = None
+
+
+def set_segue_store(store):
+    """Make find_segues, all_segues and SegueMatrixBuilder read the segues from store, finding and storing the ones missing.
+
+    Args:
+        store (SegueStore): see src.knowledge_graph.segue_store. If None, segues are always found
+    """
+    global _store
+    _store = store
+
+
+def get_segue_store():
+    """The store set with set_segue_store, None if segues are always found"""
+    return _store
+
+
+@timed_phase('segues')
 def find_segues(g1, g2, pre_filtering=pre, post_filtering=post, nodes_types_to_filter=nodes_types_to_filter_strict,  nodes_types_to_segue_not_equal=get_dict()):
     """Find all segues joining an entity1 to an entity2.
     Entities are repesented as knowledge graphs g1 and g2
@@ -41,126 +65,273 @@ def find_segues(g1, g2, pre_filtering=pre, post_filtering=post, nodes_types_to_f
 
     If the order of graphs is commuted, this method returns the same segues,
     i.e. segue representation that represent the same path, but reversed; e.g. segue type is equal but reversed.
+
+    Segues are the simple paths, up to max_path_length nodes, from the source of g1 to the source of g2 in the graph
+    obtained by merging g1 and g2, where nodes with the same content (mergiable_id) converge into the same node,
+    unless their type is in nodes_types_to_filter. The part of a path in g1 is the longest possible.
+    Since g1 and g2 are trees, a path is a root path of g1 and a root path of g2, either ending in the same node
+    (equal segue), or in two nodes judged related by a compare function (the other segues).
+    So segues are found by joining the root paths of g1 and g2, as merged, by their last node,
+    with a cost linear in the size of the trees, plus the number of segues.
+    A merged root path can stand for many nodes, e.g. the same word in track_name and album_name:
+    a segue is returned for every couple of nodes the two merged root paths stand for.
+
+    Segues are sorted by the position of the node of g1, then of the node of g2, in the depth first visit of the trees.
+    To find the segues among all the couples of many trees, all_segues is faster.
+    If a store is set with set_segue_store, segues are read from it, or found and stored.
     """
-    # First, merges g1 and g2 in a unique graph.
-    # Then, find segues as paths from the source node of g1 and the source node of g2.
-    # Then, filters out undesired nodes
-    # Finally, converts paths to the dictionary form.
+    if _store is not None:
+        kwargs = {'pre_filtering': pre_filtering, 'post_filtering': post_filtering, 'nodes_types_to_filter': nodes_types_to_filter,
+                  'nodes_types_to_segue_not_equal': nodes_types_to_segue_not_equal}
+        records = _store.records([g1, g2], lambda couples: {(0, 1): [segue_record(segue) for segue in _find_segues(g1, g2, **kwargs)]},
+                                 couples=[(0, 1)], **kwargs)
+        return [segue_from_record(g1, g2, record) for record in records[(0, 1)]]
+    return _find_segues(g1, g2, pre_filtering, post_filtering, nodes_types_to_filter, nodes_types_to_segue_not_equal)
 
-    # Efficient structure where to store the merged graph
-    g = defaultdict(set)
 
-    # Map back a tuple of nodes ids in g to a list of nodes in g1 (dictionary 0) and g2 (dictionary 1)
-    # A series of identical nodes in g can be mapped to more nodes in one of the starting graphs, we are in a multigraph scenario.
-    map_back = {'g1': {}, 'g2': {}}
+def _find_segues(g1, g2, pre_filtering, post_filtering, nodes_types_to_filter, nodes_types_to_segue_not_equal):
+    t1 = _MergedRootPaths(g1, nodes_types_to_filter)
+    t2 = _MergedRootPaths(g2, nodes_types_to_filter)
 
-    # Tells whether an edge in g was from g1 or g2 or
-    # if it was induced, i.e. resulting from the application of a compare functio to nodes from g1 and g2
-    edges = {'g1': set(), 'g2': set(), 'induced': set()}
+    # The root paths of g1 and g2 ending in the same merged node
+    candidates = [(p1, p2) for p1 in range(1, len(t1.last)) if not t1.filtered[p1] for p2 in t2.ending_in.get(t1.last[p1], [])]
 
-    # An induced edge is added as the result of the application of a compare function to two nodes
-    # In induced_edges_infos we store these information
-    induced_edges_infos = defaultdict(list)
+    return _join(g1, t1, g2, t2, candidates, pre_filtering, post_filtering, nodes_types_to_segue_not_equal)
 
-    # Here we merge graphs
 
-    # Every node in g1 and g2 is represented by a string, which is the conversion of its fields to text (mergiable_id)
-    # This automatically implements the equal compare function, as equal nodes will converge into the same node in g
-    for idx, addend in enumerate((g1, g2)):
-        id_sub_graph = f"source_{idx}"
-        stack = [((f"source_{idx}",), iter(addend['source']))]
-        while stack:
-            children = stack[-1]
-            child = next(children[1], None)
-            if child is None:
-                stack.pop()
-            else:
-                child_id = addend.nodes()[child]['mergiable_id']
-                child_id += f"__{idx}" if addend.nodes()[child]['type'] in nodes_types_to_filter else ""
+@timed_phase('segues')
+def all_segues(I, pre_filtering=pre, post_filtering=post, nodes_types_to_filter=nodes_types_to_filter_strict,  nodes_types_to_segue_not_equal=get_dict()):
+    """Find the segues between all the ordered couples of the trees in I, e.g. the songs of a playlist.
 
-                if idx == 0:
-                    g[children[0][-1]].add(child_id)
-                    edges['g1'].add((children[0][-1], child_id))
-                else:
-                    g[child_id].add(children[0][-1])
-                    edges['g2'].add((child_id, children[0][-1]))
+    The result is the same as calling find_segues on every couple, but the trees are merged once,
+    and the nodes with the same content are found through a single inverted index, merged id -> (tree, root path).
+    So, couples sharing no node cost nothing, if no compare function other than equal is given.
+    The verdicts of the default pre-filter are computed once per tree and stored in it (see pre_verdicts), others are evaluated once per node.
+    If a store is set with set_segue_store, the segues of the couples stored are read from it, the others are found and stored.
 
-                key = children[0]+(child_id,)
-                if key in map_back[f'g{idx+1}']:
-                    map_back[f'g{idx+1}'][key].append(child)
-                else:
-                    map_back[f'g{idx+1}'][key] = [child]
+    Args:
+        I (list): list of trees
+        Others: see find_segues
 
-                stack.append((children[0]+(child_id,), iter(addend[child])))
+    Returns:
+        dict: (i, j) -> segues from I[i] to I[j], as returned by find_segues(I[i], I[j]), for every i != j
+    """
+    kwargs = {'pre_filtering': pre_filtering, 'post_filtering': post_filtering, 'nodes_types_to_filter': nodes_types_to_filter,
+              'nodes_types_to_segue_not_equal': nodes_types_to_segue_not_equal}
+    if _store is not None:
+        records = _store.records(I, lambda couples: {couple: [segue_record(segue) for segue in segues]
+                                                     for couple, segues in _all_segues(I, couples, **kwargs).items()}, **kwargs)
+        return segues_from_records(I, records)
+    return _all_segues(I, list(itertools.permutations(range(len(I)), 2)), **kwargs)
+
+
+def _all_segues(I, couples, pre_filtering, post_filtering, nodes_types_to_filter, nodes_types_to_segue_not_equal):
+    """As all_segues, for the couples (i, j) given only"""
+    tries = [_MergedRootPaths(g, nodes_types_to_filter) for g in I]
+    candidates = _candidates(tries)
+
+    pre_cache = {}
+    segues = {}
+    for i, j in couples:
+        segues[(i, j)] = _join(I[i], tries[i], I[j], tries[j], sorted(candidates.get((i, j), [])),
+                               pre_filtering, post_filtering, nodes_types_to_segue_not_equal, pre_cache)
+    return segues
 
-    # Now we add edges stemming for compare functions different from equal
-    compareble_nodes_without_equal = [k for k, v in nodes_types_to_segue_not_equal.items()]
-    # Every key in d is a tuple of types, so broadcasting to type_1 and type_2
-    for type_1, type_2 in compareble_nodes_without_equal:
 
-        nodes_type_1 = [g1.nodes()[node_id] for node_id in g1.nodes() if g1.nodes()[node_id]['type'] == type_1]
-        nodes_type_2 = [g2.nodes()[node_id] for node_id in g2.nodes() if g2.nodes()[node_id]['type'] == type_2]
+def _candidates(tries):
+    """For every couple of trees sharing some node, the couples of their root paths ending in the same merged node.
+       They are found through an inverted index: merged id -> (tree, root path) for every root path ending in it.
 
-        for compare_function in [f for f in d[(type_1, type_2)] if f.__name__ != 'equal']:
+    Returns:
+        dict: (i, j) -> list of (root path of tries[i], root path of tries[j])
+    """
+    index = defaultdict(list)
+    for i, t in enumerate(tries):
+        for p in range(1, len(t.last)):
+            if not t.filtered[p]:
+                index[t.last[p]].append((i, p))
+
+    candidates = defaultdict(list)
+    for entries in index.values():
+        if len(entries) > 1:
+            for (i, p1), (j, p2) in itertools.product(entries, entries):
+                if i != j:
+                    candidates[(i, j)].append((p1, p2))
+    return candidates
+
+
+def _join(g1, t1, g2, t2, candidates, pre_filtering, post_filtering, nodes_types_to_segue_not_equal, pre_cache=None, check=True):
+    """Segues from g1 to g2, given their merged root paths and the couples of root paths ending in the same merged node.
+       If check is False, the segues are not checked against the filters, see _check_filters
+    """
+    segues = []
 
-            nodes_type_1_filtered = [n for n in nodes_type_1 if pre(n, compare_function)]
-            nodes_type_2_filtered = [n for n in nodes_type_2 if pre(n, compare_function)]
+    # Compare function == equal
+    for p1, p2 in candidates:
+        # The part in g1 of the path would be longer than p1
+        if t2.extends(t1, p1, t2.parent[p2]):
+            continue
+        if t1.depth[p1] + t2.depth[p2] + 1 > max_path_length or not _disjoint(t1, p1, t2, p2, 1):
+            continue
 
-            for n1, n2 in itertools.product(nodes_type_1_filtered, nodes_type_2_filtered):
-                result = compare_function(n1, n2)
-                if result['outcome'] == True:
+        for id_1, id_2 in itertools.product(t1.nodes[p1], t2.nodes[p2]):
 
-                    # Add the edge
-                    id_1 = f"{n1['mergiable_id']}__0" if n1['type'] not in compareble_nodes_with_equal else n1['mergiable_id']
-                    id_2 = f"{n2['mergiable_id']}__1" if n2['type'] not in compareble_nodes_with_equal else n2['mergiable_id']
-                    g[id_1].add(id_2)
-                    edges['induced'].add((id_1, id_2))
+            segue = {'n1': g1._node[id_1],
+                     'n2': g2._node[id_2],
+                     'value': g1._node[id_1]['value'],
+                     'compare_function': 'equal'}
 
-                    # Store the result of the compare function application in a dictionary
-                    result.pop('outcome')
-                    result['compare_function'] = compare_function.__name__
-                    induced_edges_infos[(n1['id'], n2['id'])].append(result)
+            if not check or _check_filters(segue, pre_filtering, post_filtering, pre_cache) == True:
+                segues.append(segue)
 
-    # Find paths in graph
-    paths = list(_all_simple_paths_graph(g, 'source_0', {'source_1'}, 50))
+    # Compare function != equal
+    # Edges between merged nodes, induced by the application of a compare function to nodes from g1 and g2
+    induced_edges = {}
+    # For every couple of nodes, the results of the compare functions that judged them related
+    induced_edges_infos = defaultdict(list)
 
-    # Convert paths to dictionary-shaped segues
-    segues = []
+    for type_1, type_2 in nodes_types_to_segue_not_equal:
 
-    # Find out which is the last node that belongs to g1 and which is the first that belongs to g2
-    # middle_leg is len==2 tuple which has as values such information
-    for j, path in enumerate(paths):
-        for idx in range(2, len(path)):
-            if tuple(path[:idx]) not in map_back['g1']:
-                idx = idx-2
-                middle_leg = (path[idx], path[idx+1])
-                break
-
-        if (tuple(path[idx:][::-1]) in map_back['g2']):
-            # Compare function == equal
-            for id_1, id_2 in itertools.product(map_back['g1'][tuple(path[0:idx+1])], map_back['g2'][tuple(path[idx:][::-1])]):
-
-                segue = {'n1': g1._node[id_1],
-                         'n2': g2._node[id_2],
-                         'value': g1._node[id_1]['value'],
-                         'compare_function': 'equal'}
-
-                if check_filters(segue, pre_filtering, post_filtering) == True:
-                    segues.append(segue)
+        nodes_type_1 = [g1._node[node_id] for node_id in g1._node if g1._node[node_id]['type'] == type_1]
+        nodes_type_2 = [g2._node[node_id] for node_id in g2._node if g2._node[node_id]['type'] == type_2]
+
+        for compare_function in [f for f in nodes_types_to_segue_not_equal[(type_1, type_2)] if f.__name__ != 'equal']:
+
+            nodes_type_1_filtered = [n for n in nodes_type_1 if _pre(n, compare_function.__name__, pre_filtering, pre_cache)]
+            nodes_type_2_filtered = [n for n in nodes_type_2 if _pre(n, compare_function.__name__, pre_filtering, pre_cache)]
+
+            for idx_1, idx_2, result in batch_compare(compare_function, nodes_type_1_filtered, nodes_type_2_filtered):
+                n1 = nodes_type_1_filtered[idx_1]
+                n2 = nodes_type_2_filtered[idx_2]
+                induced_edges[(n1['mergiable_id'], n2['mergiable_id'])] = None
+
+                # Store the result of the compare function application in a dictionary
+                result['compare_function'] = compare_function.__name__
+                induced_edges_infos[(n1['id'], n2['id'])].append(result)
 
-        elif middle_leg in edges['induced']:
-            # Compare function != equal
-            for id_1, id_2 in itertools.product(map_back['g1'][tuple(path[0:idx+1])], map_back['g2'][tuple(path[idx+1:][::-1])]):
+    induced_candidates = []
+    for id_1, id_2 in induced_edges:
+        for p1 in t1.ending_in.get(id_1, []):
+            for p2 in t2.ending_in.get(id_2, []):
+                # The part in g1 of the path would be longer than p1, or the path would be an equal segue
+                if t2.extends(t1, p1, p2) or t1.extends(t2, p2, p1):
+                    continue
+                if t1.depth[p1] + t2.depth[p2] + 2 > max_path_length or not _disjoint(t1, p1, t2, p2, 0):
+                    continue
+                induced_candidates.append((p1, p2))
 
-                candidated_segues = iter([{**{'n1': g1._node[id_1], 'n2': g2._node[id_2]}, **induced_edge_infos}
-                                          for induced_edge_infos in induced_edges_infos[(id_1, id_2)]])
+    for p1, p2 in sorted(induced_candidates):
+        for id_1, id_2 in itertools.product(t1.nodes[p1], t2.nodes[p2]):
 
-                for segue in candidated_segues:
-                    if check_filters(segue, pre_filtering, post_filtering) == True:
-                        segues.append(segue)
+            candidated_segues = iter([{**{'n1': g1._node[id_1], 'n2': g2._node[id_2]}, **induced_edge_infos}
+                                      for induced_edge_infos in induced_edges_infos[(id_1, id_2)]])
 
-        else:
-            # spurious path to be discarded, valid segues enter either the if or elif branch
-            pass
+            for segue in candidated_segues:
+                if not check or _check_filters(segue, pre_filtering, post_filtering, pre_cache) == True:
+                    segues.append(segue)
 
     return segues
+
+
+def _pre(n, compare_function, pre_filtering, pre_cache=None):
+    if pre_filtering is None:
+        return True
+    if pre_filtering is pre:
+        # The verdicts of the default pre-filter are stored in the trees
+        return pre_stored(n, compare_function)
+    if pre_cache is None:
+        return pre_filtering(n, compare_function)
+    key = (id(n['graph']), n['id'], compare_function)
+    if key not in pre_cache:
+        pre_cache[key] = pre_filtering(n, compare_function)
+    return pre_cache[key]
+
+
+def _check_filters(segue, pre_filtering, post_filtering, pre_cache=None):
+    """As check_filters, with the results of pre_filtering read from the trees, or memoized in pre_cache"""
+    if not _pre(segue['n1'], segue['compare_function'], pre_filtering, pre_cache) or \
+            not _pre(segue['n2'], segue['compare_function'], pre_filtering, pre_cache):
+        return False
+
+    return check_filters(segue, None, post_filtering)
+
+
+class _MergedRootPaths():
+
+    """The root paths of a tree, where every node is represented by its content (mergiable_id), as merged by find_segues.
+       Root paths are numbered in the depth first visit of the tree, 0 is the path made of the source only.
+       Many nodes of the tree can share the same merged root path, e.g. the same word in track_name and album_name.
+
+       Nodes of the types filtered out converge with the nodes with the same content of the same tree,
+       but never with the nodes of another tree.
+    """
+
+    def __init__(self, g, nodes_types_to_filter):
+        # For every root path: the merged id of its last node, whether its type is filtered out,
+        # the root path without it, its number of nodes but source, the nodes of g it stands for
+        self.last = ['source']
+        self.filtered = [True]
+        self.parent = [-1]
+        self.depth = [0]
+        self.nodes = [['source']]
+        # (root path, merged id) -> root path extended with a node with that merged id
+        self.child = {}
+        # merged id -> root paths ending with it
+        self.ending_in = {}
+        # root path -> (merged ids of the nodes of types not filtered out in it, whether it repeats a merged node)
+        self._merged_ids = {0: (frozenset(), False)}
+
+        stack = [(0, iter(g['source']))]
+        while stack:
+            p, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+            else:
+                n = g._node[child]
+                child_id = n['mergiable_id']
+
+                c = self.child.get((p, child_id))
+                if c is None:
+                    c = len(self.last)
+                    self.child[(p, child_id)] = c
+                    self.last.append(child_id)
+                    self.filtered.append(n['type'] in nodes_types_to_filter)
+                    self.parent.append(p)
+                    self.depth.append(self.depth[p] + 1)
+                    self.nodes.append([])
+                    self.ending_in.setdefault(child_id, []).append(c)
+                self.nodes[c].append(child)
+
+                stack.append((c, iter(g[child])))
+
+    def extends(self, other, p_other, p):
+        """True if the root path p_other of the other tree, extended with the last node of the root path p of this tree,
+           is a root path of the other tree, as merged with this one
+        """
+        return p > 0 and not self.filtered[p] and (p_other, self.last[p]) in other.child
+
+    def merged_ids(self, p):
+        if p not in self._merged_ids:
+            ids, repeated = self.merged_ids(self.parent[p])
+            repeated = repeated or self.last[p] in ids or self._repeats_filtered(p)
+            self._merged_ids[p] = (ids if self.filtered[p] else ids | {self.last[p]}, repeated)
+        return self._merged_ids[p]
+
+    def _repeats_filtered(self, p):
+        # Filtered nodes are not in merged_ids, they can repeat only within a tree
+        if not self.filtered[p]:
+            return False
+        q = self.parent[p]
+        while q > 0:
+            if self.last[q] == self.last[p]:
+                return True
+            q = self.parent[q]
+        return False
+
+
+def _disjoint(t1, p1, t2, p2, shared):
+    """True if the root paths p1 and p2 share shared merged nodes only, and do not repeat nodes, i.e. they form a simple path"""
+    ids_1, repeated_1 = t1.merged_ids(p1)
+    ids_2, repeated_2 = t2.merged_ids(p2)
+    return not repeated_1 and not repeated_2 and len(ids_1 | ids_2) == len(ids_1) + len(ids_2) - shared
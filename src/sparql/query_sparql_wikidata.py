@@ -7,24 +7,42 @@ Created on Tue Jan 28 2020
 
 from SPARQLWrapper import SPARQLWrapper, JSON
 import logging
+import threading
 import time
 import sys
 
 endpoint_url = "https://query.wikidata.org/sparql"
 user_agent = "WDQS-example Python/%s.%s" % (
     sys.version_info[0], sys.version_info[1])
-sparql = SPARQLWrapper(endpoint_url, agent=user_agent)
-sparql.setReturnFormat(JSON)
+
+# Seconds a request waits for Wikidata, and attempts made before giving up.
+# They bound how long a query runs, also once construct_graph has abandoned it at its deadline.
+request_timeout = 30
+max_retries = 8
+
+# A SPARQLWrapper holds the query it runs, so every thread gets its own one.
+# This way, features querying Wikidata can be called concurrently.
+_local = threading.local()
+
+
+def _sparql():
+    if not hasattr(_local, 'sparql'):
+        _local.sparql = SPARQLWrapper(endpoint_url, agent=user_agent)
+        _local.sparql.setReturnFormat(JSON)
+        _local.sparql.setTimeout(request_timeout)
+    return _local.sparql
 
 
 def query_sparql(query):
+    sparql = _sparql()
     sparql.setQuery(query)
-    try_again = True
-    while try_again:
+    for attempt in range(max_retries):
         try:
             d = sparql.query().convert()
-            try_again = False
+            break
         except Exception as e:
+            if attempt == max_retries - 1:
+                raise
             logging.getLogger("root.sparql").warning(
                 "Internet is down, failed to run a Sparql query. Trying again ...")
             time.sleep(0.5)
@@ -33,6 +51,7 @@ def query_sparql(query):
 
 
 def ask_sparql(ask_query):
+    sparql = _sparql()
     sparql.setQuery(ask_query)
     d = sparql.query().convert()
     return d['boolean']
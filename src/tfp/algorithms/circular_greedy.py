@@ -1,15 +1,16 @@
 
-from src.knowledge_graph.walk_graph import find_segues
-from src.interestingness.interestingness_GB import interestingness
+from src.interestingness.batch_interestingness import interestingness_matrix
+from src.interestingness.top_segues import all_top_segues
 from heapq import *
 
 
-def circular_greedy(I, interestingness_weights, init=lambda I: I[0]):
+def circular_greedy(I, interestingness_weights, init=lambda I: I[0], segues_all_pairs=None):
     """Always greedy, but we move away from the seed song once expanding backwards and the other time forwards.
 
     Args:
         I (list): List of KGs representing songs
         init (func): Selects the song from which the O should start.
+        segues_all_pairs (dict, optional): Segues between all the couples of songs, as returned by all_segues. If None, only the most interesting segue of every couple is found, see all_top_segues.
 
     Returns:
         Two lists O and S with KGs representing songs and segues
@@ -19,6 +20,12 @@ def circular_greedy(I, interestingness_weights, init=lambda I: I[0]):
     pool = set(I)-set(O)
     S = []
 
+    # the most interesting segue between all the couples of songs, found at once. The others are never chosen.
+    segues_all_pairs = all_top_segues(I, 1, interestingness_weights) if segues_all_pairs is None else segues_all_pairs
+    position = {id(e): idx for idx, e in enumerate(I)}
+    # interestingness of all the segues, scored at once.
+    scores_all_pairs = {couple: scores.tolist() for couple, scores in interestingness_matrix(segues_all_pairs, interestingness_weights).items()}
+
     while pool:
 
         q = []
@@ -27,9 +34,11 @@ def circular_greedy(I, interestingness_weights, init=lambda I: I[0]):
 
         for e in pool:
 
-            segues = find_segues(O[-1], e) if len(pool) % 2 == 0 else find_segues(e, O[0])
-            for segue in segues:
-                score = interestingness([segue], **interestingness_weights)[0]
+            if len(pool) % 2 == 0:
+                couple = (position[id(O[-1])], position[id(e)])
+            else:
+                couple = (position[id(e)], position[id(O[0])])
+            for segue, score in zip(segues_all_pairs[couple], scores_all_pairs[couple]):
                 heappush(q, (-score, (id(segue), e, segue)))
 
         _, o, s = heappop(q)[1]
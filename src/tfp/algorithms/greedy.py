@@ -1,27 +1,36 @@
-from src.knowledge_graph.walk_graph import find_segues
-from src.interestingness.interestingness_GB import interestingness
+from src.knowledge_graph.walk_graph import all_segues
+from src.interestingness.batch_interestingness import interestingness_matrix
+from src.interestingness.top_segues import all_top_segues
 from src.tfp.algorithms.common import narrative_strategy_diversity_with_decay, narrative_strategy_homogeneity_with_decay
 from src.knowledge_graph.segue_type import segue_type
 from src.knowledge_graph.segue_similarity import segue_similarity
 from heapq import *
 
 
-def greedy_template(I, interestingness_weights, init=lambda I: I[0], narrative_strategy=None):
+def greedy_template(I, interestingness_weights, init=lambda I: I[0], narrative_strategy=None, segues_all_pairs=None):
     O = [init(I)]
     pool = set(I)-set(O)
     S = []
 
+    # segues between all the couples of songs, found at once.
+    # Without narrative strategy, the scores do not depend on the segues chosen so far, and only the best segues are needed.
+    if segues_all_pairs is None:
+        segues_all_pairs = all_segues(I) if narrative_strategy is not None else all_top_segues(I, 1, interestingness_weights)
+    position = {id(e): idx for idx, e in enumerate(I)}
+    # interestingness of all the segues, scored at once.
+    scores_all_pairs = {couple: scores.tolist() for couple, scores in interestingness_matrix(segues_all_pairs, interestingness_weights).items()}
+
     while pool:
 
         q = []
         for e in pool:
 
-            segues = find_segues(O[-1], e)
+            couple = (position[id(O[-1])], position[id(e)])
+            segues = segues_all_pairs[couple]
             # push dummy None segue with utility 0, in case I do not find any segue
             heappush(q, (0, (id(e), e, None)))
 
-            for segue in segues:
-                score = interestingness([segue], **interestingness_weights)[0]
+            for segue, score in zip(segues, scores_all_pairs[couple]):
 
                 # diversity
                 score = narrative_strategy(segue, S, score) if len(S) > 0 and narrative_strategy is not None else score
@@ -37,17 +46,18 @@ def greedy_template(I, interestingness_weights, init=lambda I: I[0], narrative_s
     return O, S
 
 
-def greedy(I, interestingness_weights, init=lambda I: I[0]):
+def greedy(I, interestingness_weights, init=lambda I: I[0], segues_all_pairs=None):
     """Solve the tfp using the greedy solution.
 
     Args:
         I (list): List of KGs representing songs.
         init (func): Selects the song from which the O should start.
+        segues_all_pairs (dict, optional): Segues between all the couples of songs, as returned by all_segues. If None, only the most interesting segue of every couple is found, see all_top_segues.
 
     Returns:
         Two lists O and S with KGs representing songs and segues
     """
-    return greedy_template(I, interestingness_weights, init)
+    return greedy_template(I, interestingness_weights, init, segues_all_pairs=segues_all_pairs)
 
 
 def greedy_diversity_binary(I, interestingness_weights, init=lambda I: I[0]):
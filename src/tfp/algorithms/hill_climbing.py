@@ -1,5 +1,6 @@
 
 from src.knowledge_graph.walk_graph import find_segues
+from src.knowledge_graph.compact_segues import SegueView
 from src.interestingness.interestingness_GB import interestingness
 from random import sample, choice
 import numpy as np
@@ -53,6 +54,7 @@ def hill_climbing_template(I, interestingness_weights, n_restarts=1, patience=0,
     # Write original position of elements in I, now I is a list [(0, I[0]), ... , (n, I[n])]
     I = [e for e in enumerate(I)]
     # Dictionary indixed by the original position of elements in I, that holds all the segues between that couple.
+    # If not given, it is filled lazily, one couple at a time. It can be given as a CompactSegues, e.g. built by SegueMatrixBuilder.
     d_segues = {} if d_segues is None else d_segues
 
     solutions = [None]*n_restarts
@@ -122,7 +124,8 @@ def hill_climbing_template(I, interestingness_weights, n_restarts=1, patience=0,
                 else:
                     break
 
-        solutions[n_restart] = ([e for _, e in best_O], best_S)
+        # Compact segues are returned as dictionaries
+        solutions[n_restart] = ([e for _, e in best_O], [s.copy() if isinstance(s, SegueView) else s for s in best_S])
 
     if return_solutions_for_all_restarts:
         return_value = solutions
@@ -133,12 +136,14 @@ def hill_climbing_template(I, interestingness_weights, n_restarts=1, patience=0,
     return return_value
 
 
-def hill_climbing(I, interestingness_weights):
+def hill_climbing(I, interestingness_weights, segues_all_pairs=None):
     """Parameters found after experimentation.
     This is the best configuration in terms of average interestingness,
     which performs great also in terms of std, min, max.
 
     The n_restarts was set by picking a number after the elbow.
     After 100, the gain in performance is limited.
+
+    segues_all_pairs (dict, optional) are the segues between all the couples of songs, as returned by all_segues.
     """
-    return hill_climbing_template(I, interestingness_weights, n_restarts=40,  patience=10)
+    return hill_climbing_template(I, interestingness_weights, n_restarts=40,  patience=10, d_segues=segues_all_pairs)
@@ -5,15 +5,15 @@ Created on Tue Apr 13 2021
 """
 
 
-from src.knowledge_graph.walk_graph import find_segues
 import tempfile
 import os
 import numpy as np
-from src.interestingness.interestingness_GB import interestingness
+from src.interestingness.batch_interestingness import interestingness_matrix
+from src.interestingness.top_segues import all_top_segues
 from concorde.tsp import TSPSolver
 
 
-def optimal(I, interestingness_weights):
+def optimal(I, interestingness_weights, segues_all_pairs=None):
     """Finds the optimal tour of songs that maximise interestingness.
 
     It works using the Concorde TSP tool, https://github.com/jvkersch/pyconcorde.
@@ -24,10 +24,21 @@ def optimal(I, interestingness_weights):
     Args:
         I (list): List of KGs representing songs.
         init (func): Selects the song from which the O should start.
+        segues_all_pairs (dict, optional): Segues between all the couples of songs, as returned by all_segues. If None, only the most interesting segue of every couple is found, see all_top_segues.
 
     Returns:
         Two lists O and S with KGs representing songs and segues
     """
+    # the most interesting segue between every couple of songs, (score, segue) or None if there is no segue.
+    if segues_all_pairs is None:
+        # only the best segues are scored and filtered.
+        best = {couple: (top[0]['interestingness'], top[0]) if len(top) else None
+                for couple, top in all_top_segues(I, 1, interestingness_weights).items()}
+    else:
+        best = {}
+        for couple, scores in interestingness_matrix(segues_all_pairs, interestingness_weights).items():
+            best[couple] = (scores.max(), segues_all_pairs[couple][int(scores.argmax())]) if len(scores) else None
+
     # build reward matrix based on interestingness of going from one song to another.
     matrix = np.zeros((len(I), len(I)))
     for i in range(len(I)):
@@ -35,10 +46,9 @@ def optimal(I, interestingness_weights):
 
             if i == j:
                 matrix[i, j] = 0.0
+                continue
 
-            segues = find_segues(I[i], I[j])
-            scores = interestingness(segues, **interestingness_weights)
-            matrix[i, j] = max(scores) if len(scores) else 0.0
+            matrix[i, j] = best[(i, j)][0] if best[(i, j)] is not None else 0.0
 
     # matrix might be not symmetric due to sampled interestingness. we force it to be so.
     matrix = (matrix + matrix.T)/2
@@ -70,9 +80,6 @@ def optimal(I, interestingness_weights):
     # build output.
     O = [I[idx] for idx in solution]
     S = []
-    for s_1, s_2 in zip(O, O[1:]):
-        segues = find_segues(s_1, s_2)
-        scores = interestingness(segues, **interestingness_weights)
-        segues = sorted(segues, key=lambda segue: -scores[segues.index(segue)])
-        S.append(segues[0] if len(segues) else None)
+    for i, j in zip(solution, solution[1:]):
+        S.append(best[(i, j)][1] if best[(i, j)] is not None else None)
     return O, S
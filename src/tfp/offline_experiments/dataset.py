@@ -1,10 +1,11 @@
 import os
-import numpy as np
 import pandas as pd
 from tqdm import tqdm
 from src.data.data import raw_dataset_path, preprocessed_dataset_path
-from src.knowledge_graph.construct_graph import construct_graph
-from src.knowledge_graph.applicable_actions import InformativeActionSupplier
+from src.knowledge_graph.kg_store import KGStore
+from src.knowledge_graph.applicable_actions import ActionsSupplier, InformativeActionSupplier
+from src.knowledge_graph.io import save_graphs
+from src.features.stats import save_stats
 
 
 def prepare_dataset(folder_name, random_state, start_from=0):
@@ -15,8 +16,8 @@ def prepare_dataset(folder_name, random_state, start_from=0):
     The minimum playlist length is 5.
     So the dataset is of 920 playlists: 46 buckets of 20 playlists.
 
-    Then, it builds song trees from the songs in the playlists we selected.
-    The song trees are built with the informative part of the KG.
+    Then, it builds song trees from the songs in the playlists we selected, or reads them from the KG store if already built.
+    The song trees are derived from the full trees in the store, keeping the informative part of the KG only.
     """
     playlists = pd.read_csv(f"{raw_dataset_path}/spotify_recsys2018/playlists.csv", sep='\t', lineterminator='\r', usecols=['num_tracks', 'pid'])
 
@@ -63,10 +64,9 @@ def prepare_dataset(folder_name, random_state, start_from=0):
             nested_tree_seeds.append(tree_seeds)
 
     os.makedirs(f"{preprocessed_dataset_path}/tfp/{folder_name}/", exist_ok=True)
+    store = KGStore(supplier_factory=ActionsSupplier)
     for playlist_number, tree_seeds in enumerate(tqdm(nested_tree_seeds)):
         if playlist_number >= start_from:
-            trees = []
-            for d in tree_seeds:
-                g = construct_graph(d, supplier=InformativeActionSupplier())
-                trees.append(g)
-            np.save(f"{preprocessed_dataset_path}/tfp/{folder_name}/{playlist_number}", trees)
+            trees = store.project(tree_seeds, InformativeActionSupplier)
+            save_graphs(f"{preprocessed_dataset_path}/tfp/{folder_name}/{playlist_number}", trees)
+            save_stats()
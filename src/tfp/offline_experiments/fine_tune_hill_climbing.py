@@ -6,6 +6,7 @@ Created on Mon Jan 11 2021
 
 from src.data.data import preprocessed_dataset_path
 from src.knowledge_graph.io import load_sub_graphs_generator
+from src.knowledge_graph.segue_matrix import SegueMatrixBuilder
 from src.interestingness.interestingness_GB import interestingness
 from src.tfp.algorithms import *
 import matplotlib.ticker as ticker
@@ -70,14 +71,17 @@ def algorithm(I, patience, d_segues):
 def _save():
     patience_values = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
     results = {k: [] for k in patience_values}
+    builder = SegueMatrixBuilder()
 
     for playlist_reader in tqdm(load_sub_graphs_generator(f"tfp/side")):
         songs = playlist_reader()
-        d_segues = {}
+        # Segues are kept for all the runs, compactly
+        d_segues = builder.compact_segues(songs)
         for patience in patience_values:
             solutions = algorithm(songs, patience, d_segues)
             v = [np.array(interestingness(segues, **best_interestingness_weights())) for _, segues in solutions]
             results[patience].append(v)
+    builder.shutdown()
 
     try:
         l = np.load(f"{preprocessed_dataset_path}/tfp/performance/fine_tune_hill_climbing.npy", allow_pickle=True).item()
@@ -17,6 +17,8 @@ from src.utils.experiments import trunc
 from src.knowledge_graph.io import load_sub_graphs_generator
 from src.interestingness.interestingness_GB import interestingness
 from src.interestingness.interestingness_GB import best_interestingness_weights
+from src.features.stats import record_segues, save_stats
+from src.knowledge_graph.segue_matrix import SegueMatrixBuilder, segues_from_records
 plt.style.use('science')
 
 
@@ -114,10 +116,14 @@ def _save(algorithms):
     """
     interestingness_scores = {algorithm.__name__: [] for algorithm in algorithms}
     segue_types = {algorithm.__name__: [] for algorithm in algorithms}
+    builder = SegueMatrixBuilder()
     for playlist_reader in tqdm(load_sub_graphs_generator(f"tfp/main")):
         songs = playlist_reader()
+        # The segues among the songs are computed once, in parallel, every algorithm gets its own copy
+        records = builder.records(songs)
         for algorithm in algorithms:
-            _, segues = algorithm(songs, best_interestingness_weights())
+            _, segues = algorithm(songs, best_interestingness_weights(), segues_all_pairs=segues_from_records(songs, records))
+            record_segues(segues)
             interestingness_scores[algorithm.__name__].append(interestingness(segues, **best_interestingness_weights()))
             segue_types[algorithm.__name__].append([segue_type(s) for s in segues])
 
@@ -133,6 +139,9 @@ def _save(algorithms):
 
         np.save(f"{preprocessed_dataset_path}/tfp/performance/{file_name}", to_save)
 
+    builder.shutdown()
+    save_stats()
+
 
 if __name__ == "__main__":
     algos = [optimal, hill_climbing, greedy, ]
@@ -1,5 +1,3 @@
-import cProfile
-import pstats
 import numpy as np
 from tqdm import tqdm
 import pandas as pd
@@ -12,6 +10,7 @@ from src.tfp.algorithms import *
 from src.interestingness.interestingness_GB import best_interestingness_weights
 from src.knowledge_graph.segue_type import segue_type
 from src.tfp.offline_experiments.utils import *
+from src.utils.timing import phase_time, reset_phases
 plt.style.use('science')
 
 
@@ -58,15 +57,12 @@ def _save(algorithms):
     for playlist_reader in tqdm(load_sub_graphs_generator(f"tfp/main")):
         songs = playlist_reader()
         for algorithm in algorithms:
+            interestingness_weights = best_interestingness_weights()
 
-            with cProfile.Profile() as pr:
-                _, segues = algorithm(songs, best_interestingness_weights())
-            ps = pstats.Stats(pr).get_stats_profile()
-            try:
-                timing_interestingness = ps.func_profiles['interestingness'].cumtime
-            except KeyError:
-                timing_interestingness = 0
-            timing[algorithm.__name__].append((timing_interestingness + ps.func_profiles['find_segues'].cumtime, len(segues)))
+            # The time spent finding and scoring segues, whatever functions the algorithm does it with, see timed_phase
+            reset_phases()
+            _, segues = algorithm(songs, interestingness_weights)
+            timing[algorithm.__name__].append((phase_time('segues'), len(segues)))
 
     try:
         old = np.load(f"{preprocessed_dataset_path}/tfp/performance/timing.npy", allow_pickle=True).item()
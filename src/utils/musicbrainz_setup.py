@@ -1,4 +1,30 @@
 import musicbrainzngs
+import musicbrainzngs.compat
+import socket
+import urllib.request
+
+# Seconds a request waits for MusicBrainz. musicbrainzngs takes no timeout, and its openers would wait
+# for as long as the default timeout of socket, unbounded unless set. The timeout is given to the requests
+# of musicbrainzngs only, the default of socket, shared by the whole process, is left untouched.
+# With the at most 8 attempts of musicbrainzngs, it bounds how long a call runs, also once
+# construct_graph has abandoned it at its deadline.
+request_timeout = 30
+
+
+class _TimeoutHandler(urllib.request.BaseHandler):
+
+    """Gives request_timeout to the requests opened without an explicit timeout"""
+
+    def http_request(self, req):
+        if req.timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+            req.timeout = request_timeout
+        return req
+
+    https_request = http_request
+
+
+def _build_opener(*handlers):
+    return urllib.request.build_opener(*handlers, _TimeoutHandler())
 
 
 def musicbrainzngs_setup():
@@ -7,3 +33,5 @@ def musicbrainzngs_setup():
         "0.1",
     )
     musicbrainzngs.set_rate_limit(limit_or_interval=False)
+    # musicbrainzngs builds an opener per request, through its compat module
+    musicbrainzngs.compat.build_opener = _build_opener
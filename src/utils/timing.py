@@ -5,6 +5,9 @@ Created on Fri Feb 21 2020
 """
 
 
+from collections import defaultdict
+from functools import wraps
+import threading
 import time
 import datetime
 
@@ -20,3 +23,45 @@ def tick(name=""):
 def tock(name=""):
     global d
     return datetime.timedelta(seconds=time.time()-d[name]).total_seconds()
+
+
+# Phase name -> seconds spent in the functions of the phase, see timed_phase
+phases = defaultdict(float)
+
+# Phases the calling thread is in
+_local = threading.local()
+
+
+def timed_phase(name):
+    """Decorator adding the time spent in the calls of a function to the phase name.
+       Calls made within the call of another function of the same phase are not counted twice,
+       e.g. the scoring of the segues within all_top_segues.
+    """
+    def decorator(func):
+
+        @wraps(func)
+        def func_wrapper(*args, **kwargs):
+            active = _local.__dict__.setdefault('active', set())
+            if name in active:
+                return func(*args, **kwargs)
+
+            active.add(name)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                phases[name] += time.perf_counter() - start
+                active.discard(name)
+
+        return func_wrapper
+
+    return decorator
+
+
+def phase_time(name):
+    """Seconds spent in the phase name since the last reset_phases"""
+    return phases[name]
+
+
+def reset_phases():
+    phases.clear()
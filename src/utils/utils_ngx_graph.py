@@ -1,3 +1,7 @@
+from src.knowledge_graph.compact_tree import CompactNode
+import hashlib
+
+
 
 def successors_iter(node):
 
@@ -93,18 +97,21 @@ def father(node):
     Returns:
         ngx graph node -- None if no father
     """
+    if type(node) == CompactNode:
+        return node.father()
     for k in node['graph'].predecessors(node['id']):
         return node['graph'].nodes()[k]
 
 
 def graph_id(g):
-    """Return the unique id of the graph g
+    """Return the unique id of the graph g, from the content of its seed nodes.
+    It is deterministic, the same in every process and run.
 
     Args:
         g (ngx graph): 
 
     Returns:
-        str: The id
+        int: The id, 64 bits
     """
-    hashes = [hash(g.nodes()[n]['mergiable_id']) for n in g['source']]
-    return hash(sum(hashes))
+    mergiable_ids = sorted(g.nodes()[n]['mergiable_id'] for n in g['source'])
+    return int.from_bytes(hashlib.blake2b(repr(mergiable_ids).encode('utf-8'), digest_size=8).digest(), 'big')